@@ -2,11 +2,19 @@
 # -*- coding: utf-8 -*-
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+import base64
+import hashlib
 import json
 import os
+import threading
 from dotenv import load_dotenv
 from pathlib import Path
 import sys
+import time
+from urllib.parse import quote
+from concurrency import AdaptiveRateController, ordered_map, parse_retry_after
 
 # Get the directory where the script is located
 def init_auth():
@@ -38,7 +46,33 @@ def init_auth():
         'api_key': os.getenv('API_KEY'),
         'username': os.getenv('USERNAME'),
         'password': os.getenv('PASSWORD'),
-        'api_endpoint': os.getenv('API_ENDPOINT', 'https://api-portal1.fastgeo.com.au/api')
+        'api_endpoint': os.getenv('API_ENDPOINT', 'https://api-portal1.fastgeo.com.au/api'),
+        'upload_workers': max(1, int(os.getenv('UPLOAD_WORKERS', '1'))),
+        'http_pool_size': max(1, int(os.getenv('HTTP_POOL_SIZE', '10'))),
+        'process_workers': max(1, int(os.getenv('PROCESS_WORKERS', '4'))),
+        'process_rate': float(os.getenv('PROCESS_RATE', '2')),
+        'adaptive_rate': os.getenv('ADAPTIVE_RATE', 'false').strip().lower() == 'true',
+        'rate_retries': max(0, int(os.getenv('RATE_RETRIES', '3'))),
+        'page_size': max(1, int(os.getenv('PAGE_SIZE', '1000'))),
+        'page_workers': max(1, int(os.getenv('PAGE_WORKERS', '4'))),
+        'hole_workers': max(1, int(os.getenv('HOLE_WORKERS', '1'))),
+        'name_chunk_workers': max(1, int(os.getenv('NAME_CHUNK_WORKERS', '4'))),
+        'stream_output': os.getenv('STREAM_OUTPUT', 'false').strip().lower() == 'true',
+        'output_gzip': os.getenv('OUTPUT_GZIP', 'false').strip().lower() == 'true',
+        'upload_journal': os.getenv('UPLOAD_JOURNAL', 'true').strip().lower() == 'true',
+        'content_hash_dedup': os.getenv('CONTENT_HASH_DEDUP', 'false').strip().lower() == 'true',
+        'hash_workers': int(os.getenv('HASH_WORKERS', '0')) or os.cpu_count() or 1,
+        'image_transform': os.getenv('IMAGE_TRANSFORM', 'false').strip().lower() == 'true',
+        'image_quality': min(95, max(1, int(os.getenv('IMAGE_QUALITY', '85')))),
+        'image_max_dimension': max(0, int(os.getenv('IMAGE_MAX_DIMENSION', '0'))),
+        'transform_workers': int(os.getenv('TRANSFORM_WORKERS', '0')) or os.cpu_count() or 1,
+        'process_after_upload': os.getenv('PROCESS_AFTER_UPLOAD', 'false').strip().lower() == 'true',
+        'force_reprocess': os.getenv('FORCE_REPROCESS', 'false').strip().lower() == 'true',
+        'inventory_mirror': os.getenv('INVENTORY_MIRROR', 'false').strip().lower() == 'true',
+        'mirror_max_age_hours': float(os.getenv('MIRROR_MAX_AGE_HOURS', '24')),
+        'duplicate_analysis': os.getenv('DUPLICATE_ANALYSIS', 'false').strip().lower() == 'true',
+        'token_cache': os.getenv('TOKEN_CACHE', 'true').strip().lower() == 'true',
+        'token_refresh_margin': max(0, int(os.getenv('TOKEN_REFRESH_MARGIN', '300')))
     }
     
     # Check if we have valid authentication options
@@ -129,14 +163,99 @@ def get_request_headers(api_key, use_api_key, api_endpoint, accessToken=None):
     
     return headers
 
-def authenticate(auth_config):
+# Access tokens from username/password logins, shared by every script and run
+TOKEN_CACHE_FILE = "logs/token_cache.json"
+
+# When each access token seen by this process expires (epoch seconds)
+_token_expiry = {}
+
+def _token_cache_key(auth_config):
+    """Key cached tokens on the endpoint and username, so the password is never written to disk"""
+    return hashlib.sha256(f"{auth_config['api_endpoint']}\n{auth_config['username']}".encode('utf-8')).hexdigest()
+
+def token_expiry(token):
+    """
+    Return when an access token expires, as epoch seconds
+
+    Uses the expiry from the login response (or the token cache) when this
+    process has seen it, otherwise the 'exp' claim of the JWT.
+
+    Returns:
+        Expiry time, or None if it cannot be determined
+    """
+    if token in _token_expiry:
+        return _token_expiry[token]
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+def _read_token_cache():
+    try:
+        with open(TOKEN_CACHE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def load_cached_token(auth_config):
+    """
+    Return the cached access token for the endpoint and username if it is valid
+    for more than TOKEN_REFRESH_MARGIN seconds, else None
+    """
+    entry = _read_token_cache().get(_token_cache_key(auth_config))
+    if not entry or time.time() >= entry['expires_at'] - auth_config['token_refresh_margin']:
+        return None
+    _token_expiry[entry['access_token']] = entry['expires_at']
+    return entry['access_token']
+
+def save_cached_token(auth_config, token, expires_at):
+    """
+    Store an access token in the token cache, dropping expired entries
+
+    The file is only readable by the current user and is replaced atomically,
+    so scripts running at the same time never read a partial file.
+    """
+    now = time.time()
+    cache = {key: entry for key, entry in _read_token_cache().items() if entry.get('expires_at', 0) > now}
+    cache[_token_cache_key(auth_config)] = {'access_token': token, 'expires_at': expires_at}
+    temp_path = f"{TOKEN_CACHE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(TOKEN_CACHE_FILE), exist_ok=True)
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(temp_path, TOKEN_CACHE_FILE)
+    except OSError as e:
+        print(f"Warning: could not save the access token to {TOKEN_CACHE_FILE}: {str(e)}")
+
+def authenticate(auth_config, stale_token=None):
     """
     Perform authentication based on configuration and return auth token
+
+    With username/password authentication and TOKEN_CACHE on, a token cached
+    by an earlier run or another script is reused while it is valid for more
+    than TOKEN_REFRESH_MARGIN seconds. Otherwise a new token is requested and
+    cached with its expiry.
+
+    Args:
+        auth_config: Configuration returned by init_auth()
+        stale_token: Token that must not be returned again (e.g. one the server rejected)
+
+    Returns:
+        Access token, or None when using an API key or if login failed
     """
     token = None
     
     # Only perform login if using username/password authentication
     if auth_config['use_credentials']:
+        if auth_config['token_cache']:
+            token = load_cached_token(auth_config)
+            if token is not None and token != stale_token:
+                print(f"Using cached access token (expires {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(_token_expiry[token]))})")
+                return token
+
         print("Authenticating with username and password...")
         login_response = login(auth_config['username'], auth_config['password'], auth_config['api_endpoint'])
         if login_response is None:
@@ -144,13 +263,328 @@ def authenticate(auth_config):
             return None
     
         try:
-            token = login_response.json()["result"]["accessToken"]
+            result = login_response.json()["result"]
+            token = result["accessToken"]
+            expires_in = result.get("expireInSeconds")
+            expires_at = time.time() + expires_in if expires_in else token_expiry(token)
+            if expires_at is not None:
+                _token_expiry[token] = expires_at
+                if auth_config['token_cache']:
+                    save_cached_token(auth_config, token, expires_at)
             print("Login successful!")
             return token
-        except (KeyError, json.JSONDecodeError) as e:
+        except (KeyError, TypeError, json.JSONDecodeError) as e:
             print(f"Failed to parse login response: {str(e)}")
             print(f"Response content: {login_response.text}")
             return None
     else:
         print("Using API key authentication")
-        return None  # No token needed for API key authentication
\ No newline at end of file
+        return None  # No token needed for API key authentication
+
+class ApiResponseError(Exception):
+    """Raised when an API response is not a successful, well-formed result; keeps the response for logging"""
+
+    def __init__(self, message, response):
+        super().__init__(message)
+        self.response = response
+
+
+# Longest URL-encoded drillHoleNames value sent in one query, well under common URL limits
+MAX_NAMES_PARAM_LENGTH = 1500
+
+
+def format_names_param(names):
+    """Format names as the ["a", "b"] list the API expects in drillHoleNames"""
+    return "[" + ', '.join([f'"{name}"' for name in names]) + "]"
+
+
+def chunk_names(names, max_length=MAX_NAMES_PARAM_LENGTH):
+    """
+    Split names into chunks whose formatted list stays under max_length once URL-encoded
+
+    Returns:
+        List of lists of names, in the original order (a single name longer
+        than max_length still gets a chunk of its own)
+    """
+    chunks = []
+    current = []
+    length = len(quote("[]"))
+    separator_length = len(quote(", "))
+    for name in names:
+        name_length = len(quote(f'"{name}"'))
+        added = name_length + (separator_length if current else 0)
+        if current and length + added > max_length:
+            chunks.append(current)
+            current = []
+            length = len(quote("[]"))
+            added = name_length
+        current.append(name)
+        length += added
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _rewind_files(files):
+    """Seek file objects in a requests files= argument back to the start before a retry"""
+    if not files:
+        return
+    values = files.values() if isinstance(files, dict) else [value for _, value in files]
+    for value in values:
+        file_obj = value[1] if isinstance(value, tuple) else value
+        if hasattr(file_obj, 'seek'):
+            file_obj.seek(0)
+
+
+def _rewind_body(data):
+    """
+    Seek a streaming body passed as data= back to the start before a retry
+
+    JSON strings, bytes and form dicts are sent again as they are.
+    """
+    if hasattr(data, 'seek'):
+        data.seek(0)
+
+
+class ApiClient:
+    """
+    Shared HTTP client for the FastGeo API
+
+    Holds a single requests.Session so connections are kept alive and reused
+    across calls instead of opening a new TCP+TLS connection per request.
+    The authentication headers are built once and stored on the session.
+
+    When ADAPTIVE_RATE is enabled every request also goes through an
+    AdaptiveRateController, and requests the server rejects with 429/503
+    are retried after backing off.
+
+    With username/password authentication the access token is renewed
+    TOKEN_REFRESH_MARGIN seconds before it expires, and a request rejected
+    with 401 is retried once with a new token. The renewal is shared by all
+    threads using the client, so a burst of 401s triggers a single login.
+    """
+
+    RETRY_STATUS_CODES = (429, 503)
+
+    def __init__(self, auth_config, accessToken=None, pool_size=None, max_concurrency=None):
+        """
+        Args:
+            auth_config: Configuration returned by init_auth()
+            accessToken: Bearer token from authenticate() (None when using an API key)
+            pool_size: Maximum number of pooled connections (defaults to HTTP_POOL_SIZE)
+            max_concurrency: Ceiling for the adaptive concurrency limit (defaults to pool_size)
+        """
+        self.auth_config = auth_config
+        self.api_endpoint = auth_config['api_endpoint']
+        self.pool_size = pool_size or auth_config['http_pool_size']
+        self.max_retries = auth_config['rate_retries']
+        self.rate_controller = None
+        if auth_config['adaptive_rate']:
+            self.rate_controller = AdaptiveRateController(max_concurrency or self.pool_size)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # The token is only sent when no API key is configured (see get_request_headers)
+        self.token_auth = auth_config['use_credentials'] and not auth_config['use_api_key']
+        self._token_lock = threading.Lock()
+        self._next_refresh_at = 0
+        self.set_token(accessToken)
+
+    def set_token(self, accessToken):
+        """
+        Rebuild the session headers for a new access token
+        """
+        # Swap in a new headers object rather than editing it, as other threads may be sending requests
+        self.session.headers = CaseInsensitiveDict(get_request_headers(self.auth_config['api_key'],
+                                                                       self.auth_config['use_api_key'],
+                                                                       self.api_endpoint,
+                                                                       accessToken))
+        self.access_token = accessToken
+        self.token_expires_at = token_expiry(accessToken) if accessToken else None
+
+    def refresh_token(self, stale_token):
+        """
+        Replace stale_token with a new access token, once for all threads
+
+        If another thread already replaced it, its token is used. A fresh token
+        cached on disk by another script is reused before logging in again.
+
+        Returns:
+            The current access token, or None if authentication failed
+        """
+        with self._token_lock:
+            if self.access_token != stale_token:
+                return self.access_token
+            token = authenticate(self.auth_config, stale_token=stale_token)
+            if token is None:
+                # Wait before trying again rather than logging in on every request
+                self._next_refresh_at = time.time() + 60
+                return None
+            self.set_token(token)
+            return token
+
+    def request(self, method, url, headers=None, **kwargs):
+        """
+        Send a request through the pooled session
+
+        Per-request headers are merged over the session headers; pass a header
+        with a value of None to drop it (e.g. {'Content-Type': None} for multipart uploads).
+
+        Returns:
+            Response object
+        """
+        if not self.token_auth:
+            return self._send(method, url, headers, **kwargs)
+
+        token = self.access_token
+        expires_at = self.token_expires_at
+        now = time.time()
+        if expires_at is not None and now >= expires_at - self.auth_config['token_refresh_margin'] and now >= self._next_refresh_at:
+            token = self.refresh_token(token) or token
+
+        response = self._send(method, url, headers, **kwargs)
+        if response.status_code == 401 and self.refresh_token(token) is not None:
+            print(f"Access token rejected for {url}, retrying with a new token")
+            _rewind_files(kwargs.get('files'))
+            _rewind_body(kwargs.get('data'))
+            response = self._send(method, url, headers, **kwargs)
+        return response
+
+    def _send(self, method, url, headers=None, **kwargs):
+        if self.rate_controller is None:
+            return self.session.request(method, url, headers=headers, **kwargs)
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_controller.acquire()
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                self.rate_controller.record(time.monotonic() - start, timed_out=True)
+                raise
+            finally:
+                self.rate_controller.release()
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            self.rate_controller.record(time.monotonic() - start, response.status_code, retry_after)
+
+            # The server refused the request without processing it, so it is safe to send again
+            if response.status_code not in self.RETRY_STATUS_CODES or attempt == self.max_retries:
+                return response
+            print(f"Server returned {response.status_code} for {url}, retrying ({attempt + 1}/{self.max_retries})")
+            if retry_after is None:
+                time.sleep(min(30, 2 ** attempt))
+            _rewind_files(kwargs.get('files'))
+            _rewind_body(kwargs.get('data'))
+
+        return response
+
+    def get_page(self, url, params=None, skip_count=0, max_result_count=None):
+        """
+        Fetch a single page from a paged GetAll-style endpoint
+
+        Returns:
+            The response 'result' dict with 'totalCount' and 'items'
+
+        Raises:
+            ApiResponseError: If the request fails or the response is not the expected JSON
+        """
+        page_params = dict(params or {})
+        page_params['SkipCount'] = skip_count
+        page_params['MaxResultCount'] = max_result_count or self.auth_config['page_size']
+
+        response = self.request("GET", url, params=page_params)
+        try:
+            response.raise_for_status()
+            result = response.json()['result']
+            for key in ('items', 'totalCount'):
+                if key not in result:
+                    raise KeyError(key)
+            return result
+        except requests.exceptions.HTTPError as e:
+            raise ApiResponseError(f"Request failed for {url} (skip={skip_count}): {str(e)}", response) from e
+        except ValueError as e:
+            raise ApiResponseError(f"Failed to decode JSON response from {url} (skip={skip_count}): {str(e)}", response) from e
+        except (KeyError, TypeError) as e:
+            raise ApiResponseError(f"JSON response from {url} (skip={skip_count}) missing expected key: {str(e)}", response) from e
+
+    def get_pages(self, url, params=None, page_size=None, workers=None):
+        """
+        Yield every page of a paged GetAll-style endpoint, in order
+
+        The first page is fetched on its own to learn totalCount. The remaining
+        offsets are then fetched `workers` at a time and yielded in order, so only
+        a few pages are held in memory however large the inventory is.
+
+        Args:
+            url: Endpoint URL
+            params: Extra query parameters (SkipCount/MaxResultCount are added)
+            page_size: Items requested per page (defaults to PAGE_SIZE)
+            workers: Pages fetched concurrently (defaults to PAGE_WORKERS)
+
+        Yields:
+            Page result dicts with 'totalCount' and 'items'
+        """
+        page_size = page_size or self.auth_config['page_size']
+        workers = workers or self.auth_config['page_workers']
+
+        first_page = self.get_page(url, params, 0, page_size)
+        yield first_page
+
+        total_count = first_page['totalCount']
+        received = len(first_page['items'])
+        if received == 0 or received >= total_count:
+            return
+
+        # The server may cap the page size below what was asked for
+        step = min(page_size, received)
+        offsets = range(received, total_count, step)
+        fetch = lambda skip_count: self.get_page(url, params, skip_count, step)
+        for skip_count, future in ordered_map(fetch, offsets, workers):
+            yield future.result()
+
+    def iter_items(self, url, params=None, page_size=None, workers=None):
+        """
+        Yield the items of a paged GetAll-style endpoint one by one (see get_pages)
+        """
+        for page in self.get_pages(url, params, page_size, workers):
+            yield from page['items']
+
+    def iter_items_for_names(self, url, names, param='drillHoleNames', workers=1, params=None):
+        """
+        Yield the items for a list of names, split into URL-safe chunks fetched concurrently
+
+        Each chunk is a separate paged query; `workers` chunks are fetched at
+        once and their items yielded in chunk order. Items returned by more
+        than one chunk are yielded only once (by their 'id').
+
+        Args:
+            url: Endpoint URL
+            names: Names to query (e.g. drill hole names); duplicates are ignored
+            param: Query parameter that takes the ["a", "b"] list
+            workers: Number of chunks fetched concurrently
+            params: Extra query parameters sent with every chunk
+        """
+        chunks = chunk_names(list(dict.fromkeys(names)))
+        fetch_chunk = lambda chunk: list(self.iter_items(url, params={**(params or {}), param: format_names_param(chunk)}))
+        seen_ids = set()
+        for chunk, future in ordered_map(fetch_chunk, chunks, workers):
+            for item in future.result():
+                item_id = item.get('id')
+                if item_id is not None:
+                    if item_id in seen_ids:
+                        continue
+                    seen_ids.add(item_id)
+                yield item
+
+    def describe_rate(self):
+        """Current adaptive rate for logs, or None when adaptive rate control is off"""
+        if self.rate_controller is None:
+            return None
+        return self.rate_controller.describe()
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+# CPU-bound work (content hashing, image re-encoding) also uses thread pools rather than
+# process pools: hashlib and Pillow release the GIL, and the scripts do their work at
+# import time, so child processes would re-run them.
+
+
+def ordered_map(func, items, workers=1):
+    """
+    Run func over items on a thread pool and yield (item, future) pairs in input order
+
+    Items are pulled from the iterable lazily and at most workers * 2 of them are
+    submitted ahead of the consumer, so memory stays bounded for long manifests.
+    Because results are handed back in input order, anything the caller logs
+    is identical no matter which call finishes first.
+
+    Args:
+        func: Callable taking a single item
+        items: Iterable of items to process
+        workers: Number of worker threads (1 behaves like a serial loop)
+
+    Yields:
+        Tuple of (item, future); call future.result() to get the return value
+        or re-raise the exception raised by func
+    """
+    workers = max(1, int(workers))
+    window = workers * 2
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+            if len(pending) >= window:
+                yield pending.popleft()
+
+        while pending:
+            yield pending.popleft()
+
+
+def read_ahead(items, count):
+    """
+    Pull up to count items from an iterable ahead of the consumer
+
+    Useful when producing an item starts background work (e.g. submitting it to
+    another pool), so that work runs further ahead than ordered_map's window.
+
+    Args:
+        items: Iterable of items
+        count: Number of items to buffer ahead (0 passes items straight through)
+
+    Yields:
+        The items, in input order
+    """
+    buffered = deque()
+    for item in items:
+        buffered.append(item)
+        if len(buffered) > count:
+            yield buffered.popleft()
+
+    while buffered:
+        yield buffered.popleft()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to pace requests to a fixed rate
+
+    Each acquire() takes one token; tokens refill continuously at `rate` per
+    second up to `capacity`, so short bursts are allowed but the long-run
+    request rate never exceeds `rate`.
+    """
+
+    def __init__(self, rate, capacity=1):
+        """
+        Args:
+            rate: Tokens added per second (0 or None disables pacing)
+            capacity: Maximum number of tokens that can accumulate (burst size)
+        """
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        if not self.rate or self.rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header (delay in seconds or an HTTP date) into seconds
+
+    Returns:
+        Number of seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateController:
+    """
+    AIMD (additive increase, multiplicative decrease) concurrency controller
+
+    Every API call takes a slot with acquire() and reports how it went with
+    record(). While responses are fast and successful the concurrency limit
+    grows by about one slot per round trip; on HTTP 429/502/503/504, timeouts
+    or a Retry-After header it is cut by decrease_factor and new requests
+    wait until the Retry-After delay has passed.
+    """
+
+    CONGESTION_STATUS_CODES = (429, 502, 503, 504)
+
+    def __init__(self, max_limit, min_limit=1, initial_limit=None, decrease_factor=0.5, latency_factor=2.0, rate_window=10.0):
+        """
+        Args:
+            max_limit: Upper bound on concurrent requests (usually the worker count)
+            min_limit: Lower bound on concurrent requests
+            initial_limit: Starting limit (defaults to min_limit)
+            decrease_factor: Multiplier applied to the limit on congestion
+            latency_factor: Latency above baseline * latency_factor stops the limit from growing
+            rate_window: Seconds of history used to compute the current request rate
+        """
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial_limit or self.min_limit)))
+        self.decrease_factor = decrease_factor
+        self.latency_factor = latency_factor
+        self.rate_window = rate_window
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._baseline_latency = None
+        self._completed = deque()
+
+    def acquire(self):
+        """Block until a request slot is free and any Retry-After pause has passed"""
+        with self._cond:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self._in_flight < int(self.limit):
+                    self._in_flight += 1
+                    return
+                else:
+                    self._cond.wait()
+
+    def release(self):
+        """Give back a slot taken by acquire()"""
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def record(self, latency=None, status_code=None, retry_after=None, timed_out=False):
+        """
+        Feed the outcome of a request into the controller
+
+        Args:
+            latency: Request duration in seconds
+            status_code: HTTP status code, or None if no response was received
+            retry_after: Seconds from the Retry-After header, if any
+            timed_out: True when the request timed out or the connection failed
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._completed.append(now)
+            while self._completed and now - self._completed[0] > self.rate_window:
+                self._completed.popleft()
+
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+            if timed_out or status_code in self.CONGESTION_STATUS_CODES or retry_after is not None:
+                # A burst of failures from the same overload should only cut the limit once
+                if self.limit > self.min_limit and now - self._last_decrease > max(1.0, self._baseline_latency or 0.0):
+                    old_limit = self.limit
+                    self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+                    self._last_decrease = now
+                    reason = 'timeout' if timed_out else f'HTTP {status_code}'
+                    if retry_after is not None:
+                        reason += f', Retry-After {retry_after:.1f}s'
+                    print(f"Rate control: server pushed back ({reason}), concurrency {old_limit:.1f} -> {self.limit:.1f}")
+            elif status_code is not None and status_code < 500 and latency is not None:
+                # Baseline follows faster responses immediately and slower ones gradually
+                if self._baseline_latency is None or latency < self._baseline_latency:
+                    self._baseline_latency = latency
+                else:
+                    self._baseline_latency += (latency - self._baseline_latency) * 0.01
+
+                if latency <= self._baseline_latency * self.latency_factor and self.limit < self.max_limit:
+                    self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+            self._cond.notify_all()
+
+    @property
+    def current_rate(self):
+        """Completed requests per second over the last rate_window seconds"""
+        with self._cond:
+            now = time.monotonic()
+            recent = [t for t in self._completed if now - t <= self.rate_window]
+        return len(recent) / self.rate_window
+
+    def describe(self):
+        """One-line summary of the controller state for logs"""
+        return (f"concurrency limit {int(self.limit)}/{self.max_limit}, "
+                f"in flight {self._in_flight}, {self.current_rate:.2f} requests/sec")
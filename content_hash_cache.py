@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path):
+    """
+    Compute the SHA-256 of a file, reading it in chunks
+
+    Returns:
+        Hex digest string
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentHashCache:
+    """
+    SQLite cache of file content hashes and of the content already uploaded
+
+    Hashes are keyed on (path, size, mtime) so a file is only re-hashed when it changes.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Path of the SQLite database file (created if missing)
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS uploaded_content (
+                project_id INTEGER NOT NULL,
+                prospect_id INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                image_id INTEGER,
+                path TEXT,
+                uploaded_at TEXT NOT NULL,
+                PRIMARY KEY (project_id, prospect_id, sha256)
+            )
+        """)
+        self.conn.commit()
+
+    def hash_files(self, paths, workers=None):
+        """
+        Return the SHA-256 of each file, hashing only files that are new or changed
+
+        Args:
+            paths: Iterable of file paths
+            workers: Number of hashing threads (defaults to the CPU count)
+
+        Returns:
+            Tuple of (dict path -> sha256 for readable files, number of files hashed)
+        """
+        hashes = {}
+        to_hash = []
+        for path in dict.fromkeys(str(p) for p in paths):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            row = self.conn.execute("SELECT size, mtime_ns, sha256 FROM file_hashes WHERE path = ?", (path,)).fetchone()
+            if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                hashes[path] = row[2]
+            else:
+                to_hash.append((path, stat.st_size, stat.st_mtime_ns))
+
+        if to_hash:
+            with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+                digests = list(executor.map(lambda entry: self._try_hash(entry[0]), to_hash))
+            with self.conn:
+                for (path, size, mtime_ns), digest in zip(to_hash, digests):
+                    if digest is None:
+                        continue
+                    hashes[path] = digest
+                    self.conn.execute("INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                                      (path, size, mtime_ns, digest))
+
+        return hashes, len(to_hash)
+
+    @staticmethod
+    def _try_hash(path):
+        try:
+            return sha256_file(path)
+        except OSError:
+            return None
+
+    def uploaded_hashes(self, projectId, prospectId):
+        """Return the set of content hashes already uploaded successfully to the project and prospect"""
+        rows = self.conn.execute("SELECT sha256 FROM uploaded_content WHERE project_id = ? AND prospect_id = ?",
+                                 (projectId, prospectId)).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_uploaded(self, projectId, prospectId, sha256, image_id=None, path=None):
+        """Record that a file with this content was uploaded successfully"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO uploaded_content (project_id, prospect_id, sha256, image_id, path, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (projectId, prospectId, sha256, image_id, path, datetime.now().isoformat(timespec='seconds'))
+            )
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from image_index import DEPTH_TOLERANCE
+
+ISSUE_COLUMNS = ['Issue', 'HoleID', 'StandardType', 'From', 'To', 'First', 'Second']
+
+
+def find_depth_issues(intervals, tolerance=DEPTH_TOLERANCE):
+    """
+    Find overlapping and gapped box depth intervals per drill hole and image type
+
+    Intervals are sorted by (hole, standard type, depth from, depth to) and swept
+    once with a running maximum of depth to, so the check is O(n log n) rather
+    than comparing every pair of boxes. Each box is compared with the box that
+    reaches deepest among those before it:
+
+    - overlap: the box starts above that depth
+    - gap: the box starts below that depth, leaving an uncovered range
+
+    Boxes with identical depth ranges are duplicates rather than overlaps and are
+    left to the duplicate checks. Issues are only reported when at least one of
+    the two boxes comes from the manifest, so problems among boxes already on
+    the server are not repeated on every run.
+
+    Args:
+        intervals: DataFrame with columns hole_name, standard_type, depth_from,
+                   depth_to, label (e.g. "line 5" or "server image 12") and
+                   from_manifest (bool)
+        tolerance: Depths closer than this are treated as equal
+
+    Returns:
+        DataFrame with ISSUE_COLUMNS, one row per overlap or gap
+    """
+    if intervals.empty:
+        return pd.DataFrame(columns=ISSUE_COLUMNS)
+
+    # Identical ranges are duplicates; keep one box for each, preferring the server copy
+    df = intervals.assign(from_key=np.round(intervals['depth_from'].to_numpy(dtype=float) / tolerance),
+                          to_key=np.round(intervals['depth_to'].to_numpy(dtype=float) / tolerance))
+    df = df.sort_values(['hole_name', 'standard_type', 'from_key', 'to_key', 'from_manifest'], kind='mergesort')
+    df = df.drop_duplicates(['hole_name', 'standard_type', 'from_key', 'to_key']).reset_index(drop=True)
+
+    group = df.groupby(['hole_name', 'standard_type'], sort=False).ngroup().to_numpy()
+    depth_from = df['depth_from'].to_numpy(dtype=float)
+    depth_to = df['depth_to'].to_numpy(dtype=float)
+    position = np.arange(len(df))
+
+    # Running maximum of depth to within each group, and the box it belongs to
+    running_max = df.groupby(group, sort=False)['depth_to'].cummax().to_numpy(dtype=float)
+    owner = np.maximum.accumulate(np.where(depth_to >= running_max, position, 0))
+
+    same_group = np.zeros(len(df), dtype=bool)
+    same_group[1:] = group[1:] == group[:-1]
+    previous_max = np.full(len(df), np.nan)
+    previous_max[1:] = running_max[:-1]
+    previous_owner = np.zeros(len(df), dtype=int)
+    previous_owner[1:] = owner[:-1]
+
+    from_manifest = df['from_manifest'].to_numpy(dtype=bool)
+    involves_manifest = from_manifest | from_manifest[previous_owner]
+    overlap = same_group & involves_manifest & (depth_from < previous_max - tolerance)
+    gap = same_group & involves_manifest & (depth_from > previous_max + tolerance)
+
+    labels = df['label'].to_numpy(dtype=object)
+    issues = []
+    for kind, mask, issue_from, issue_to in (
+        ('overlap', overlap, depth_from, np.minimum(previous_max, depth_to)),
+        ('gap', gap, previous_max, depth_from),
+    ):
+        rows = np.flatnonzero(mask)
+        issues.append(pd.DataFrame({
+            'Issue': kind,
+            'HoleID': df['hole_name'].to_numpy()[rows],
+            'StandardType': df['standard_type'].to_numpy()[rows],
+            'From': issue_from[rows],
+            'To': issue_to[rows],
+            'First': labels[previous_owner[rows]],
+            'Second': labels[rows],
+        }, columns=ISSUE_COLUMNS))
+
+    result = pd.concat(issues, ignore_index=True)
+    return result.sort_values(['HoleID', 'StandardType', 'From'], kind='mergesort').reset_index(drop=True)
+
+
+def find_reference_overlaps(intervals, reference, tolerance=DEPTH_TOLERANCE):
+    """
+    Find the intervals that overlap any reference interval of the same hole and image type
+
+    For each hole and type the reference boxes are sorted by depth from with a
+    running maximum of depth to, so each interval is checked with one binary
+    search: it overlaps when a reference box starting above its depth to
+    reaches below its depth from.
+
+    Args:
+        intervals: DataFrame with hole_name, standard_type, depth_from, depth_to
+        reference: DataFrame with hole_name, standard_type, depth_from, depth_to
+        tolerance: Depths closer than this are treated as equal
+
+    Returns:
+        Boolean numpy array aligned with intervals, True where it overlaps a reference box
+    """
+    overlaps = np.zeros(len(intervals), dtype=bool)
+    if intervals.empty or reference.empty:
+        return overlaps
+
+    positions = pd.Series(np.arange(len(intervals)), index=intervals.index)
+    reference_groups = dict(tuple(reference.groupby(['hole_name', 'standard_type'], sort=False)))
+    for key, group in intervals.groupby(['hole_name', 'standard_type'], sort=False):
+        ref = reference_groups.get(key)
+        if ref is None:
+            continue
+        ref = ref.sort_values('depth_from', kind='mergesort')
+        ref_from = ref['depth_from'].to_numpy(dtype=float)
+        ref_max_to = np.maximum.accumulate(ref['depth_to'].to_numpy(dtype=float))
+        # Reference boxes starting above each interval's depth to
+        starts_above = np.searchsorted(ref_from, group['depth_to'].to_numpy(dtype=float) - tolerance, side='left')
+        reaches = np.zeros(len(group), dtype=bool)
+        has_candidates = starts_above > 0
+        reaches[has_candidates] = (ref_max_to[starts_above[has_candidates] - 1]
+                                   > group['depth_from'].to_numpy(dtype=float)[has_candidates] + tolerance)
+        overlaps[positions[group.index].to_numpy()] = reaches
+    return overlaps
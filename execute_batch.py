@@ -3,12 +3,14 @@
 # coding: utf-8
 
 import requests
-import json
 import os
 import csv
 from datetime import datetime
-import time
-from authentication import init_auth, authenticate, get_request_headers
+from authentication import init_auth, authenticate, ApiClient, ApiResponseError, chunk_names
+from concurrency import ordered_map, TokenBucket
+from process_pipeline import process_image
+from process_state import ProcessState, PROCESSED, FAILED
+from inventory_mirror import InventoryMirror
 
 # Initialize authentication
 auth_config = init_auth()
@@ -19,6 +21,17 @@ api_key = auth_config['api_key']
 api_endpoint = auth_config['api_endpoint']
 use_api_key = auth_config['use_api_key']
 use_credentials = auth_config['use_credentials']
+process_workers = auth_config['process_workers']
+process_rate = auth_config['process_rate']
+force_reprocess = auth_config['force_reprocess']
+name_chunk_workers = auth_config['name_chunk_workers']
+
+# The mirror holds one project and prospect, while this script otherwise queries the holes across all projects
+if auth_config['inventory_mirror'] and not (auth_config['projectId'] and auth_config['prospectId']):
+    print("ERROR: INVENTORY_MIRROR=true needs PROJECT_ID and PROSPECT_ID in .env for execute_batch.py, "
+          "since the mirror only holds the images of one project and prospect. "
+          "Set them, or set INVENTORY_MIRROR=false to query the drill holes across all projects.")
+    exit(1)
 
 # Create timestamp for log files
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -47,90 +60,36 @@ def read_hole_ids():
             hole_ids.append(row['HoleID'])
     return hole_ids
 
-def get_all_images(hole_ids, accessToken=None):
-    """
-    Get all images for specific project, prospect and hole IDs
+def get_all_images(hole_ids):
     """
-    hole_ids_param = ', '.join([f'"{hole_id}"' for hole_id in hole_ids])
-    url = f"{api_endpoint}/services/app/Image/GetAll?drillHoleNames=[{hole_ids_param}]&MaxResultCount=100000"
-    print(f"Fetching images from URL: {url}")
-    payload = {}
-    headers = get_request_headers(api_key, use_api_key, api_endpoint, accessToken)
-
-    try:
-        response = requests.request("GET", url, headers=headers, data=payload)
-        response.raise_for_status()
-        return response
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching images: {str(e)}")
-        if 'response' in locals():
-            print(f"Response status code: {response.status_code}")
-            print(f"Response content: {response.text}")
-        return None
+    Get all images for specific project, prospect and hole IDs, fetched page by page
 
-def process_image(image_id, workflow_id, accessToken=None):
-    """
-    Process an image with the specified workflow
+    Hole IDs are queried in URL-safe chunks, NAME_CHUNK_WORKERS chunks at a time,
+    and images returned by more than one chunk are kept once. With
+    INVENTORY_MIRROR on, the images of PROJECT_ID/PROSPECT_ID are synced into the
+    local mirror and read from there instead.
     Returns:
-        - On success: Response object
-        - On failure: Tuple(None, error_details)
+        - On success: List of image items
+        - On failure: None
     """
-    url = f"{api_endpoint}/services/app/Image/ProcessImage"
-
-    payload = json.dumps({
-        "imageId": image_id,
-        "workflowId": workflow_id
-    })
-    headers = get_request_headers(api_key, use_api_key, api_endpoint, accessToken)
-
-    error_details = {
-        'error_type': None,
-        'error_message': None,
-        'status_code': None,
-        'response_content': None,
-        'request_url': url,
-        'request_payload': payload
-    }
+    url = f"{api_endpoint}/services/app/Image/GetAll"
 
     try:
-        response = requests.request("POST", url, headers=headers, data=payload, timeout=30)
-        response.raise_for_status()
-        return response, None
-
-    except requests.exceptions.Timeout:
-        error_details.update({
-            'error_type': 'Timeout',
-            'error_message': f"Request timed out after 30 seconds for image {image_id}"
-        })
-        return None, error_details
-
-    except requests.exceptions.ConnectionError as e:
-        error_details.update({
-            'error_type': 'ConnectionError',
-            'error_message': f"Connection failed for image {image_id}: {str(e)}"
-        })
-        return None, error_details
-
-    except requests.exceptions.HTTPError as e:
-        error_details.update({
-            'error_type': 'HTTPError',
-            'error_message': f"HTTP error occurred for image {image_id}: {str(e)}",
-            'status_code': e.response.status_code,
-            'response_content': e.response.text
-        })
-        return None, error_details
-
+        if mirror:
+            print(f"Reading images for {len(hole_ids)} drill holes from the inventory mirror")
+            return list(mirror.synced_images(auth_config['projectId'], auth_config['prospectId'], hole_ids,
+                                             max_age_hours=auth_config['mirror_max_age_hours']))
+        chunks = chunk_names(list(dict.fromkeys(hole_ids)))
+        print(f"Fetching images from URL: {url} for {len(hole_ids)} drill holes in {len(chunks)} queries")
+        return list(client.iter_items_for_names(url, hole_ids, workers=name_chunk_workers))
     except requests.exceptions.RequestException as e:
-        error_details.update({
-            'error_type': 'RequestException',
-            'error_message': f"Request failed for image {image_id}: {str(e)}"
-        })
-        if hasattr(e, 'response') and e.response is not None:
-            error_details.update({
-                'status_code': e.response.status_code,
-                'response_content': e.response.text
-            })
-        return None, error_details
+        print(f"Error fetching images: {str(e)}")
+        return None
+    except ApiResponseError as e:
+        print(f"Error fetching images: {str(e)}")
+        print(f"Response status code: {e.response.status_code}")
+        print(f"Response content: {e.response.text}")
+        return None
 
 # Initialize logger
 with open(log_file, 'w', encoding='utf-8') as f:
@@ -156,6 +115,13 @@ with open(log_file, 'a', encoding='utf-8') as f:
     else:
         f.write(f"Using API key authentication\n")
 
+# Shared keep-alive session, with enough pooled connections for every dispatch worker
+client = ApiClient(auth_config, token, pool_size=max(auth_config['http_pool_size'], process_workers),
+                   max_concurrency=process_workers)
+
+# Optional local mirror of the inventory, refreshed incrementally instead of downloaded in full every run
+mirror = InventoryMirror(client, api_endpoint) if auth_config['inventory_mirror'] else None
+
 # Get all images
 # Get hole IDs from CSV
 hole_ids = read_hole_ids()
@@ -163,38 +129,64 @@ print(f"Found {len(hole_ids)} hole IDs to process: {', '.join(hole_ids)}")
 
 # Get all images for specified hole IDs
 print(f"Fetching images for drill holes: {hole_ids}...")
-images_response = get_all_images(hole_ids, token)
-if images_response is None:
+images_data = get_all_images(hole_ids)
+if images_data is None:
     print("Failed to fetch images. Check the log file for details.")
     with open(log_file, 'a', encoding='utf-8') as f:
         f.write(f"Failed to fetch images at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
     exit(1)
 
-try:
-    images_data = images_response.json()['result']['items']
-    total_images = len(images_data)
-    print(f"Found {total_images} images to process")
-    with open(log_file, 'a', encoding='utf-8') as f:
-        f.write(f"Found {total_images} images to process\n")
-except (KeyError, json.JSONDecodeError) as e:
-    print(f"Failed to parse images response: {str(e)}")
-    with open(log_file, 'a', encoding='utf-8') as f:
-        f.write(f"Failed to parse images response: {str(e)}\n")
-    exit(1)
+# Skip images already processed with this workflow, unless FORCE_REPROCESS is set
+process_state = ProcessState()
+already_processed = process_state.processed_ids(workflow_id)
+found_images = len(images_data)
+if force_reprocess:
+    skipped_images = 0
+else:
+    images_data = [image for image in images_data if image['id'] not in already_processed]
+    skipped_images = found_images - len(images_data)
+
+total_images = len(images_data)
+print(f"Found {found_images} images, {skipped_images} already processed with workflow {workflow_id}")
+print(f"Found {total_images} images to process")
+with open(log_file, 'a', encoding='utf-8') as f:
+    f.write(f"Found {found_images} images, {skipped_images} already processed with workflow {workflow_id} "
+            f"(state file: {process_state.path}, force reprocess: {force_reprocess})\n")
+    f.write(f"Found {total_images} images to process\n")
 
 # Initialize success and failure counters
 successful_images = []
 failed_images = []
 
+# Pace ProcessImage calls across all workers instead of sleeping after each image
+rate_limiter = TokenBucket(process_rate)
+
+def dispatch_image(indexed_image):
+    """
+    Send ProcessImage for one image once the rate limiter allows it (runs on a worker thread)
+
+    Returns:
+        Tuple of (response, error_details, finished_at)
+    """
+    i, image = indexed_image
+    rate_limiter.acquire()
+    process_response, error_details = process_image(client, api_endpoint, image['id'], workflow_id)
+    return process_response, error_details, datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
 # Process all images
 print("\nStarting image processing...")
 print(f"Total images to process: {total_images}")
 print("Progress: 0/{} (0%)".format(total_images))
+print(f"Dispatching with {process_workers} worker(s), rate limit: {process_rate if process_rate > 0 else 'unlimited'} requests/sec")
 with open(log_file, 'a', encoding='utf-8') as f:
     f.write(f"\nStarting image processing at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
     f.write(f"Total images to process: {total_images}\n")
+    f.write(f"Workers: {process_workers}, rate limit: {process_rate if process_rate > 0 else 'unlimited'} requests/sec\n")
+    f.write(f"Adaptive rate control: {'on' if client.rate_controller else 'off'}\n")
 
-for i, image in enumerate(images_data):
+# Several ProcessImage requests are in flight at once; results are handled in
+# the original image order so the progress output and CSVs stay the same
+for (i, image), future in ordered_map(dispatch_image, enumerate(images_data), process_workers):
     image_id = image['id']
     filename = image['files'][0]['fileName'] if image['files'] else 'Unknown'
     drill_hole_name = image['drillHole']['name'] if image['drillHole'] else 'Unknown'
@@ -217,8 +209,8 @@ for i, image in enumerate(images_data):
         f.write(f"  Drill Hole: {drill_hole_name}\n")
         f.write(f"  Depth Range: {depth_from} - {depth_to}\n")
     
-    # Process the image with the workflow
-    process_response, error_details = process_image(image_id, workflow_id, token)
+    # Wait for the workflow request for this image
+    process_response, error_details, finished_at = future.result()
     
     image_info = {
         'Image ID': image_id,
@@ -226,7 +218,7 @@ for i, image in enumerate(images_data):
         'Drill Hole': drill_hole_name,
         'Depth From': depth_from,
         'Depth To': depth_to,
-        'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        'Timestamp': finished_at
     }
     
     if process_response and process_response.status_code == 200:
@@ -234,6 +226,7 @@ for i, image in enumerate(images_data):
         with open(log_file, 'a', encoding='utf-8') as f:
             f.write(f"  + Successfully processed\n")
         successful_images.append(image_info)
+        process_state.record(image_id, workflow_id, PROCESSED, finished_at)
     else:
         # Log detailed error information
         with open(log_file, 'a', encoding='utf-8') as f:
@@ -255,21 +248,25 @@ for i, image in enumerate(images_data):
         image_info['Error'] = error_msg
         image_info['Error Type'] = error_details['error_type']
         failed_images.append(image_info)
-    # Add a small delay to avoid overwhelming the API
-    time.sleep(0.5)
+        process_state.record(image_id, workflow_id, FAILED, finished_at)
     
     # Print progress summary every 20 images
     if (i+1) % 20 == 0:
         print(f"\n--- Progress Summary ---")
         print(f"Processed: {i+1}/{total_images} images ({completion_percentage}%)")
         print(f"Success: {len(successful_images)}, Failed: {len(failed_images)}")
+        if client.rate_controller:
+            rate_status = client.describe_rate()
+            print(f"Rate control: {rate_status}")
+            with open(log_file, 'a', encoding='utf-8') as f:
+                f.write(f"  Rate control: {rate_status}\n")
         print(f"------------------------\n")
-    time.sleep(0.5)
 
 # Write summary to log
 with open(log_file, 'a', encoding='utf-8') as f:
     f.write(f"\n=== Processing Summary ===\n")
     f.write(f"Total Images: {total_images}\n")
+    f.write(f"Skipped (already processed): {skipped_images}\n")
     f.write(f"Successfully Processed: {len(successful_images)}\n")
     f.write(f"Failed to Process: {len(failed_images)}\n")
     f.write(f"Completion Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
@@ -292,6 +289,7 @@ if failed_images:
 # Print final summary
 print(f"\n=== Processing Complete! ===")
 print(f"Total Images: {total_images}")
+print(f"Skipped (already processed): {skipped_images}")
 success_percent = round(len(successful_images)/total_images*100, 1) if total_images > 0 else 0
 failed_percent = round(len(failed_images)/total_images*100, 1) if total_images > 0 else 0
 print(f"Successfully Processed: {len(successful_images)} ({success_percent}%)")
@@ -299,4 +297,8 @@ print(f"Failed to Process: {len(failed_images)} ({failed_percent}%)")
 print(f"Log file: {log_file}")
 
 if len(failed_images) > 0:
-    print(f"\nSome images failed to process. Check {failed_file} for details.")
\ No newline at end of file
+    print(f"\nSome images failed to process. Check {failed_file} for details.")
+
+process_state.close()
+if mirror:
+    mirror.close()
@@ -8,8 +8,12 @@ import requests
 import json
 import os
 import csv
+import gzip
+import shutil
+import tempfile
 from datetime import datetime
-from authentication import init_auth, authenticate, get_request_headers
+from authentication import init_auth, authenticate, ApiClient
+from concurrency import ordered_map
 
 debug = True
 
@@ -21,6 +25,10 @@ api_key = auth_config['api_key']
 api_endpoint = auth_config['api_endpoint']
 use_api_key = auth_config['use_api_key']
 use_credentials = auth_config['use_credentials']
+page_workers = auth_config['page_workers']
+hole_workers = auth_config['hole_workers']
+stream_output = auth_config['stream_output']
+output_gzip = auth_config['output_gzip']
 
 # Create log file with timestamp
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -39,6 +47,15 @@ if token is None and use_credentials:
     print("Authentication failed. Please check your credentials and try again.")
     exit(1)
 
+# Shared keep-alive session, with enough pooled connections for every hole and page worker
+client = ApiClient(auth_config, token, pool_size=max(auth_config['http_pool_size'], hole_workers * page_workers))
+
+# Column order of the summary and detailed CSV files (matches the dicts built in process_image_row_data)
+SUMMARY_COLUMNS = ['projectName', 'prospectName', 'drillHoleName', 'imageId', 'ocrId', 'ocrType', 'ocrText',
+                   'rowIndex', 'x', 'y', 'width', 'height', 'originalX']
+DETAILED_COLUMNS = ['projectName', 'prospectName', 'drillHoleName', 'imageId', 'outlineName', 'isPolyComplete',
+                    'rowFrom', 'rowTo', 'numPoints']
+
 def load_drill_holes_from_csv(csv_path="sendtobatch.csv"):
     """
     Read the sendtobatch.csv file and extract drill hole IDs.
@@ -64,7 +81,7 @@ def load_drill_holes_from_csv(csv_path="sendtobatch.csv"):
         print(f"Error loading drill holes from CSV: {str(e)}")
         return []
 
-def get_image_row_data(projectId, prospectId, accessToken=None, skip_count=0, max_result_count=100, drill_hole_name=None):
+def get_image_row_data(projectId, prospectId, skip_count=0, max_result_count=100, drill_hole_name=None):
     """
     Get image row data from the API
     This includes manual corrections by the user adjusting line segments and block depths
@@ -72,7 +89,6 @@ def get_image_row_data(projectId, prospectId, accessToken=None, skip_count=0, ma
     Args:
         projectId: Project ID
         prospectId: Prospect ID
-        accessToken: Authentication token
         skip_count: Number of records to skip
         max_result_count: Maximum number of records to return per request
         drill_hole_name: Optional filter by drill hole name
@@ -89,10 +105,9 @@ def get_image_row_data(projectId, prospectId, accessToken=None, skip_count=0, ma
         print(f"Filtering results by drill hole: {drill_hole_name}")
     
     payload = {}
-    headers = get_request_headers(api_key, use_api_key, api_endpoint, accessToken)
     
     try:
-        response = requests.request("GET", url, headers=headers, data=payload)
+        response = client.request("GET", url, data=payload)
         response.raise_for_status()  # Raise an exception for bad status codes
         return response.json()
     except requests.exceptions.RequestException as e:
@@ -102,59 +117,98 @@ def get_image_row_data(projectId, prospectId, accessToken=None, skip_count=0, ma
             print(f"Response content: {response.text}")
         return None
 
-def get_all_image_row_data(projectId, prospectId, accessToken=None, batch_size=100, drill_hole_name=None):
+def iter_image_row_batches(projectId, prospectId, batch_size=100, drill_hole_name=None, workers=None):
     """
-    Get all image row data by making multiple API calls until all results are retrieved
+    Yield image row data one API response at a time, in SkipCount order
+
+    The first batch is fetched on its own to learn totalCount. The remaining
+    offsets are then fetched concurrently and yielded in order, so only a few
+    batches are held in memory at once.
     
     Args:
         projectId: Project ID
         prospectId: Prospect ID
-        accessToken: Authentication token
         batch_size: Number of records to retrieve per API call
         drill_hole_name: Optional filter by drill hole name
+        workers: Number of batches fetched concurrently (defaults to PAGE_WORKERS)
         
-    Returns:
-        Combined results from all API calls
+    Yields:
+        Response JSON data for each batch, or None (and then stops) if a request fails
     """
-    all_items = []
-    skip_count = 0
-    total_count = None
+    workers = workers or page_workers
     
     print(f"Retrieving image row data for {drill_hole_name if drill_hole_name else 'all drill holes'}...")
+    print(f"Fetching batch: skip=0, max={batch_size}")
+    
+    # Get the first batch to learn the total count
+    response_data = get_image_row_data(
+        projectId,
+        prospectId,
+        skip_count=0,
+        max_result_count=batch_size,
+        drill_hole_name=drill_hole_name
+    )
     
-    while total_count is None or skip_count < total_count:
-        print(f"Fetching batch: skip={skip_count}, max={batch_size}")
+    if response_data is None:
+        print("Failed to get image row data. Please check your parameters and try again.")
+        yield None
+        return
+    
+    total_count = response_data['result']['totalCount']
+    retrieved = len(response_data['result']['items'])
+    print(f"Total records to retrieve: {total_count}")
+    print(f"Retrieved {retrieved} items. Total so far: {retrieved}/{total_count}")
+    yield response_data
+    
+    # The remaining offsets are known now, so fetch them in parallel
+    if 0 < retrieved < total_count:
+        step = min(batch_size, retrieved)  # the server may cap the batch size
+        offsets = range(retrieved, total_count, step)
+        print(f"Fetching {len(offsets)} remaining batches with {workers} worker(s)")
         
-        # Get the current batch of results
-        response_data = get_image_row_data(
+        fetch_batch = lambda skip_count: get_image_row_data(
             projectId,
             prospectId,
-            accessToken,
             skip_count=skip_count,
-            max_result_count=batch_size,
+            max_result_count=step,
             drill_hole_name=drill_hole_name
         )
         
+        # Batches come back in offset order, whichever request finishes first
+        for skip_count, future in ordered_map(fetch_batch, offsets, workers):
+            batch_data = future.result()
+            if batch_data is None:
+                print(f"Failed to get image row data at skip={skip_count}. Please check your parameters and try again.")
+                yield None
+                return
+            
+            retrieved += len(batch_data['result']['items'])
+            print(f"Retrieved {len(batch_data['result']['items'])} items (skip={skip_count}). Total so far: {retrieved}/{total_count}")
+            yield batch_data
+
+def get_all_image_row_data(projectId, prospectId, batch_size=100, drill_hole_name=None, workers=None):
+    """
+    Get all image row data by making multiple API calls until all results are retrieved
+    
+    Args:
+        projectId: Project ID
+        prospectId: Prospect ID
+        batch_size: Number of records to retrieve per API call
+        drill_hole_name: Optional filter by drill hole name
+        workers: Number of batches fetched concurrently (defaults to PAGE_WORKERS)
+        
+    Returns:
+        Combined results from all API calls
+    """
+    all_items = []
+    total_count = None
+    
+    for response_data in iter_image_row_batches(projectId, prospectId, batch_size, drill_hole_name, workers):
         if response_data is None:
-            print("Failed to get image row data. Please check your parameters and try again.")
             return None
-        
-        # Update the total count
         if total_count is None:
             total_count = response_data['result']['totalCount']
-            print(f"Total records to retrieve: {total_count}")
-        
-        # Add the items from this batch to our collection
-        items = response_data['result']['items']
-        all_items.extend(items)
-        print(f"Retrieved {len(items)} items. Total so far: {len(all_items)}/{total_count}")
-        
-        # Increment the skip count for the next batch
-        skip_count += len(items)
-        
-        # If we didn't get as many items as we requested, we're done
-        if len(items) < batch_size:
-            break
+        all_items.extend(response_data['result']['items'])
     
     # Create a result structure similar to the original API response
     combined_result = {
@@ -266,6 +320,110 @@ def process_image_row_data(response_data):
             print(f"Response content: {json.dumps(response_data, indent=2)}")
         return [], [], []
 
+def stream_drill_hole_to_parts(drill_hole, part_prefix):
+    """
+    Fetch one drill hole batch by batch, writing each batch to part files as it arrives
+    
+    Args:
+        drill_hole: Drill hole name
+        part_prefix: Path prefix for this hole's part files
+        
+    Returns:
+        Dict with the part file paths and counts, or None if a request failed
+    """
+    parts = {
+        'raw': f"{part_prefix}.ndjson",
+        'summary': f"{part_prefix}_summary.csv",
+        'detailed': f"{part_prefix}_detailed.csv",
+        'items': 0,
+        'summary_rows': 0,
+        'detailed_rows': 0
+    }
+    
+    with open(parts['raw'], 'w', encoding='utf-8') as raw_file, \
+         open(parts['summary'], 'w', newline='', encoding='utf-8') as summary_file, \
+         open(parts['detailed'], 'w', newline='', encoding='utf-8') as detailed_file:
+        # Same line endings as the pandas CSV files written in the default mode
+        summary_writer = csv.DictWriter(summary_file, fieldnames=SUMMARY_COLUMNS, lineterminator=os.linesep)
+        detailed_writer = csv.DictWriter(detailed_file, fieldnames=DETAILED_COLUMNS, lineterminator=os.linesep)
+        
+        for response_data in iter_image_row_batches(projectId, prospectId, drill_hole_name=drill_hole):
+            if response_data is None:
+                return None
+            
+            summary_data, detailed_summary, items = process_image_row_data(response_data)
+            for item in items:
+                raw_file.write(json.dumps(item) + "\n")
+            summary_writer.writerows(summary_data)
+            detailed_writer.writerows(detailed_summary)
+            
+            parts['items'] += len(items)
+            parts['summary_rows'] += len(summary_data)
+            parts['detailed_rows'] += len(detailed_summary)
+    
+    return parts
+
+def append_csv_part(part_path, output_path, columns):
+    """
+    Append a headerless CSV part file to an output CSV, writing the header first if the output is new
+    """
+    is_new = not os.path.exists(output_path)
+    with open(output_path, 'a', newline='', encoding='utf-8') as output_file:
+        if is_new:
+            csv.writer(output_file, lineterminator=os.linesep).writerow(columns)
+        with open(part_path, 'r', newline='', encoding='utf-8') as part_file:
+            shutil.copyfileobj(part_file, output_file)
+
+def stream_all_drill_holes(drill_holes):
+    """
+    Streaming output mode: write newline-delimited JSON and CSV rows as batches arrive
+    
+    Each drill hole worker writes its batches to its own part files, and the main
+    thread appends finished parts to the output files in the order of sendtobatch.csv.
+    Peak memory is a few batches per worker, whatever the export size.
+    """
+    raw_path = os.path.join(logs_dir, f"image_row_data_raw_{timestamp}.ndjson" + (".gz" if output_gzip else ""))
+    summary_csv = os.path.join(success_dir, f"image_row_summary_{timestamp}.csv")
+    detailed_csv = os.path.join(success_dir, f"image_row_detailed_{timestamp}.csv")
+    total_records = 0
+    
+    print(f"Streaming {len(drill_holes)} drill holes with {hole_workers} worker(s) to {raw_path}")
+    
+    with tempfile.TemporaryDirectory(prefix="image_row_parts_", dir=logs_dir) as part_dir:
+        indexed_holes = list(enumerate(drill_holes))
+        fetch_hole = lambda indexed_hole: stream_drill_hole_to_parts(indexed_hole[1], os.path.join(part_dir, f"part_{indexed_hole[0]}"))
+        
+        raw_file = gzip.open(raw_path, 'wt', encoding='utf-8') if output_gzip else open(raw_path, 'w', encoding='utf-8')
+        with raw_file:
+            for (i, drill_hole), future in ordered_map(fetch_hole, indexed_holes, hole_workers):
+                print(f"\n--- Processing drill hole: {drill_hole} ---")
+                
+                parts = future.result()
+                if parts is None:
+                    print(f"Failed to get image row data for {drill_hole}. Skipping to next drill hole.")
+                    continue
+                
+                # Append this hole's parts to the combined outputs, then drop them
+                with open(parts['raw'], 'r', encoding='utf-8') as part_file:
+                    shutil.copyfileobj(part_file, raw_file)
+                if parts['summary_rows']:
+                    append_csv_part(parts['summary'], summary_csv, SUMMARY_COLUMNS)
+                if parts['detailed_rows']:
+                    append_csv_part(parts['detailed'], detailed_csv, DETAILED_COLUMNS)
+                for key in ('raw', 'summary', 'detailed'):
+                    os.remove(parts[key])
+                
+                total_records += parts['items']
+                print(f"Added {parts['items']} items from {drill_hole}.")
+    
+    print(f"Raw data from all drill holes saved to {raw_path} ({total_records} records)")
+    if os.path.exists(summary_csv):
+        print(f"Summary data from all drill holes saved to {summary_csv}")
+    if os.path.exists(detailed_csv):
+        print(f"Detailed data from all drill holes saved to {detailed_csv}")
+    
+    print(f"\nAll {len(drill_holes)} drill holes processed and combined into single output files.")
+
 # Main execution
 def main():
     # Load drill hole IDs from sendtobatch.csv
@@ -275,18 +433,27 @@ def main():
         print("No drill holes found in sendtobatch.csv. Please check the file and try again.")
         exit(1)
     
+    if stream_output:
+        stream_all_drill_holes(drill_holes)
+        return
+    
     # Initialize containers for merged data
     all_summary_data = []
     all_detailed_summary = []
     all_items = []
     total_records = 0
     
+    # Fetch several drill holes at once, each with its own paging; results are
+    # merged in the order of sendtobatch.csv so the output files are stable
+    fetch_hole = lambda drill_hole: get_all_image_row_data(projectId, prospectId, drill_hole_name=drill_hole)
+    print(f"Processing {len(drill_holes)} drill holes with {hole_workers} worker(s)")
+    
     # Process each drill hole
-    for drill_hole in drill_holes:
+    for drill_hole, future in ordered_map(fetch_hole, drill_holes, hole_workers):
         print(f"\n--- Processing drill hole: {drill_hole} ---")
         
-        # Make the API call to get image row data for this drill hole
-        response_data = get_all_image_row_data(projectId, prospectId, token, drill_hole_name=drill_hole)
+        # Wait for the image row data for this drill hole
+        response_data = future.result()
         
         if response_data is None:
             print(f"Failed to get image row data for {drill_hole}. Skipping to next drill hole.")
@@ -4,12 +4,15 @@
 
 # %%
 import pandas as pd
-import requests
+import numpy as np
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from authentication import init_auth, authenticate, get_request_headers
+from authentication import init_auth, authenticate, ApiClient
+from inventory_mirror import InventoryMirror
+from image_index import DEPTH_TOLERANCE
 debug = True
 
 # Initialize authentication
@@ -20,6 +23,7 @@ api_key = auth_config['api_key']
 api_endpoint = auth_config['api_endpoint']
 use_api_key = auth_config['use_api_key']
 use_credentials = auth_config['use_credentials']
+duplicate_analysis = auth_config['duplicate_analysis']
 num_errors = 1
 
 # %%
@@ -38,45 +42,181 @@ if token is None and use_credentials:
     print("Authentication failed. Please check your credentials and try again.")
     exit(1)
 
+# Shared keep-alive session for all API calls
+client = ApiClient(auth_config, token)
 
-def get_all_images(projectId, prospectId, accessToken=None):
-    url = f"{api_endpoint}/services/app/Image/GetAll?ProjectIds={projectId}&ProspectIds={prospectId}&MaxResultCount=100000"
+# Optional local mirror of the inventory, refreshed incrementally instead of downloaded in full every run
+mirror = InventoryMirror(client, api_endpoint) if auth_config['inventory_mirror'] else None
+mirror_max_age = auth_config['mirror_max_age_hours']
 
-    payload = {}
-    headers = get_request_headers(api_key, use_api_key, api_endpoint, accessToken)
 
-    response = requests.request("GET", url, headers=headers, data=payload)
+def get_all_images(projectId, prospectId):
+    """
+    Stream all images for the project and prospect, fetched page by page (or from the inventory mirror)
+    """
+    if mirror:
+        return mirror.synced_images(projectId, prospectId, max_age_hours=mirror_max_age)
+    url = f"{api_endpoint}/services/app/Image/GetAll"
+    return client.iter_items(url, params={'ProjectIds': projectId, 'ProspectIds': prospectId})
 
-    return response
-
-res = get_all_images(projectId, prospectId, token)  # token will be None if using API key
+import csv
 
-data = res.json()['result']['items']
-image_data = [[x['files'][0]['fileName'], x['depthFrom'], x['depthTo'], x['standardType'], x['imageClass'], x['type'],x['drillHole']['id']] for x in data]
-uploaded_files = []
-for x in image_data:
-    base_name = x[0].replace(f"_{x[0].split('_')[-1]}", "")+f"_{x[1]}"
-    if x[4] == 1:  # If imageClass = 1
-        uploaded_files.append(f"{base_name}_Dry")
-    elif x[4] == 2:  # If imageClass = 2
-        uploaded_files.append(f"{base_name}_Wet")
-    else:
-        uploaded_files.append(base_name)
+DUPLICATE_KEYS = ['drillHoleID', 'depthFrom', 'depthTo', 'imageClass', 'standardType']
+
+def find_duplicate_images(images):
+    """
+    Group images on (drill hole ID, depth from, depth to, image class, standard type)
+
+    Depths are compared on the DEPTH_TOLERANCE grid used by upload_image.py, and
+    the grouping is done with pandas over the whole inventory at once.
+
+    Args:
+        images: DataFrame with 'Image ID', 'File Name' and the DUPLICATE_KEYS columns
+
+    Returns:
+        DataFrame with one row per group of two or more images: the key fields,
+        the number of images, and all their image IDs and file names
+    """
+    keys = images[DUPLICATE_KEYS].copy()
+    for column in ['depthFrom', 'depthTo']:
+        keys[column] = np.round(pd.to_numeric(keys[column], errors='coerce') / DEPTH_TOLERANCE)
+    duplicated = keys.duplicated(keep=False).to_numpy()
+    duplicates = images[duplicated].assign(_group=keys[duplicated].groupby(DUPLICATE_KEYS, dropna=False).ngroup())
+    if duplicates.empty:
+        return pd.DataFrame(columns=DUPLICATE_KEYS + ['Count', 'Image IDs', 'File Names'])
+    duplicates = duplicates.sort_values(['_group', 'Image ID'], kind='mergesort')
+    grouped = duplicates.groupby('_group', sort=False)
+    report = grouped[DUPLICATE_KEYS].first()
+    report['Count'] = grouped.size()
+    report['Image IDs'] = grouped['Image ID'].agg(lambda ids: ';'.join(str(i) for i in ids))
+    report['File Names'] = grouped['File Name'].agg(lambda names: ';'.join(str(n) for n in names))
+    return report.sort_values(['drillHoleID', 'depthFrom', 'depthTo'], kind='mergesort').reset_index(drop=True)
+
+ROLLUP_COLUMNS = ["Hole Name", "ID", "Image Count", "Dry Images", "Wet Images", "Other Images",
+                  "Min Depth", "Max Depth", "Covered Length", "maxDepth"]
+
+def get_all_holes():
+    """
+    Stream the project and prospect's drill holes, fetched page by page (or from the inventory mirror)
+    """
+    if mirror:
+        return mirror.synced_drill_holes(projectId, prospectId, max_age_hours=mirror_max_age)
+    url = f"{api_endpoint}/services/app/DrillHole/GetAll"
+    items = client.iter_items(url, params={'ProjectIds': projectId, 'ProspectIds': prospectId})
+    # Ignore holes from other projects/prospects if the server returns them
+    return (item for item in items
+            if item.get('projectId', projectId) == projectId and item.get('prospectId', prospectId) == prospectId)
+
+def export_drill_holes(output_csv):
+    """
+    Write each drill hole to output_csv as its page arrives
+
+    Args:
+        output_csv: Path of the drill holes CSV file
+
+    Returns:
+        DataFrame with the 'ID', 'Hole Name' and 'maxDepth' of every drill hole, for the hole rollup
+    """
+    holes = []
+    with open(output_csv, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(["Hole Name","ID","drillHoleStatus","elevation","northing","easting","longitude","latitude","dip","azimuth","rl","maxDepth"])  # Add a header row
+        for x in get_all_holes():
+            writer.writerow([x['name'], x['id'], x['drillHoleStatus'], x['elevation'], x['northing'],\
+                             x['easting'], x['longitude'], x['latitude'], x['dip'], x['azimuth'], x['rl'], x['maxDepth']])
+            holes.append((x['id'], x['name'], x['maxDepth']))
+    return pd.DataFrame(holes, columns=['ID', 'Hole Name', 'maxDepth'])
+
+def build_hole_rollup(images, drill_holes):
+    """
+    Summarise the images of each drill hole
+
+    Covered Length is the length of the union of the image depth ranges, so
+    overlapping or repeated images are only counted once.
+
+    Args:
+        images: DataFrame with 'ID', 'Hole Name', 'depthFrom', 'depthTo' and 'standardType' per image
+        drill_holes: DataFrame returned by export_drill_holes
+
+    Returns:
+        DataFrame with ROLLUP_COLUMNS, one row per drill hole (holes without images included)
+    """
+    images = images.assign(depthFrom=pd.to_numeric(images['depthFrom'], errors='coerce'),
+                           depthTo=pd.to_numeric(images['depthTo'], errors='coerce'))
+    images = images.sort_values(['ID', 'depthFrom'], kind='mergesort')
+    # Each range only adds the part beyond the furthest depth covered by the earlier ranges of the hole
+    covered_to = images.groupby('ID')['depthTo'].cummax()
+    previous_to = covered_to.groupby(images['ID']).shift()
+    start = np.fmax(images['depthFrom'], previous_to)
+    images['covered'] = (images['depthTo'] - start).clip(lower=0)
+    # upload_image.py sends Dry/Wet as the standard type (1 for Dry, 2 for Wet)
+    standard_type = pd.to_numeric(images['standardType'], errors='coerce')
+    images['dry'] = standard_type == 1
+    images['wet'] = standard_type == 2
+
+    grouped = images.groupby('ID')
+    rollup = pd.DataFrame({
+        'Image Count': grouped.size(),
+        'Dry Images': grouped['dry'].sum(),
+        'Wet Images': grouped['wet'].sum(),
+        'Min Depth': grouped['depthFrom'].min(),
+        'Max Depth': grouped['depthTo'].max(),
+        'Covered Length': grouped['covered'].sum().round(4),
+        'Image Hole Name': grouped['Hole Name'].first(),
+    }).reset_index()
+    rollup['Other Images'] = rollup['Image Count'] - rollup['Dry Images'] - rollup['Wet Images']
+
+    rollup = drill_holes.merge(rollup, on='ID', how='outer')
+    rollup['Hole Name'] = rollup['Hole Name'].fillna(rollup['Image Hole Name'])
+    counts = ['Image Count', 'Dry Images', 'Wet Images', 'Other Images']
+    rollup[counts] = rollup[counts].fillna(0).astype(int)
+    return rollup[ROLLUP_COLUMNS].sort_values('Hole Name', kind='mergesort')
+
+# Specify the output CSV file names
+output_csv = output_dir / f"uploaded_files_{timestamp}.csv"
+holes_csv = output_dir / f"drill_holes_{timestamp}.csv"
 
+# Write each image to the CSV file as its page arrives, counting file names for the duplicate check.
+# The drill holes are exported at the same time on a second thread; the inventory mirror can only be
+# used from one thread, so with the mirror on they are exported after the images.
 tmp = {}
-for i in uploaded_files:
-    if i not in tmp:
-        tmp[i] = 1
-    else:
-        tmp[i] += 1
+# Structured fields of every image for DUPLICATE_ANALYSIS, kept as compact columns
+analysis_columns = {column: [] for column in ['Image ID', 'File Name'] + DUPLICATE_KEYS}
+# Hole, depth range and standard type of every image, for the hole rollup
+rollup_rows = []
+with ThreadPoolExecutor(max_workers=1) as executor:
+    holes_future = None if mirror else executor.submit(export_drill_holes, holes_csv)
+    with open(output_csv, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(["File Name","depthFrom","depthTo","standardType","imageClass","type","drillHoleID"])  # Add a header row
+        for x in get_all_images(projectId, prospectId):
+            file_name,depthFrom,depthTo,standardType,imageClass,type,drillHoleID = \
+                x['files'][0]['fileName'], x['depthFrom'], x['depthTo'], x['standardType'], x['imageClass'], x['type'], x['drillHole']['id']
+            writer.writerow([file_name,depthFrom,depthTo,standardType,imageClass,type,drillHoleID])
+            rollup_rows.append((drillHoleID, x['drillHole'].get('name'), depthFrom, depthTo, standardType))
+            if duplicate_analysis:
+                for column, value in zip(analysis_columns, [x['id'], file_name, drillHoleID, depthFrom, depthTo, imageClass, standardType]):
+                    analysis_columns[column].append(value)
+
+            base_name = file_name.replace(f"_{file_name.split('_')[-1]}", "")+f"_{depthFrom}"
+            if imageClass == 1:  # If imageClass = 1
+                uploaded_file = f"{base_name}_Dry"
+            elif imageClass == 2:  # If imageClass = 2
+                uploaded_file = f"{base_name}_Wet"
+            else:
+                uploaded_file = base_name
+            tmp[uploaded_file] = tmp.get(uploaded_file, 0) + 1
+
+    print(f"Uploaded files saved to {output_csv}")
+    drill_holes = holes_future.result() if holes_future else export_drill_holes(holes_csv)
+
+print(f"Drill holes files saved to {holes_csv}")
 
 duplicated_files = []
 for i in tmp:
     if tmp[i] > 1:
         duplicated_files.append(i)
 
-import csv
-
 # Specify the output CSV file name
 output_csv = output_dir / f"duplicated_files_{timestamp}.csv"
 
@@ -88,42 +228,22 @@ with open(output_csv, mode='w', newline='', encoding='utf-8') as file:
 
 print(f"Duplicated files saved to {output_csv}")
 
-# Specify the output CSV file name
-output_csv = output_dir / f"uploaded_files_{timestamp}.csv"
-
-# Write the uploaded_files list to the CSV file
-with open(output_csv, mode='w', newline='', encoding='utf-8') as file:
-    writer = csv.writer(file)
-    writer.writerow(["File Name","depthFrom","depthTo","standardType","imageClass","type","drillHoleID"])  # Add a header row
-    for file_name,depthFrom,depthTo,standardType,imageClass,type,drillHoleID in image_data:
-        writer.writerow([file_name,depthFrom,depthTo,standardType,imageClass,type,drillHoleID])
-
-print(f"Uploaded files saved to {output_csv}")
-
-def get_all_holes(accessToken=None):
-    url = f"{api_endpoint}/services/app/DrillHole/GetAll?MaxResultCount=100000"
-
-    payload = {}
-    headers = get_request_headers(api_key, use_api_key, api_endpoint, accessToken)
-    response = requests.request("GET", url, headers=headers, data=payload)
-
-    return response
-
-res = get_all_holes(token)  # token will be None if using API key
-data = res.json()['result']['items']
-drill_holes = [[x['name'], x['id'], x['drillHoleStatus'], x['elevation'], x['northing'],\
-                x['easting'], x['longitude'], x['latitude'], x['dip'], x['azimuth'], x['rl'], x['maxDepth']] for x in data]
-
-import csv
-
-# Specify the output CSV file name
-output_csv = output_dir / f"drill_holes_{timestamp}.csv"
-
-# Write the uploaded_files list to the CSV file
-with open(output_csv, mode='w', newline='', encoding='utf-8') as file:
-    writer = csv.writer(file)
-    writer.writerow(["Hole Name","ID","drillHoleStatus","elevation","northing","easting","longitude","latitude","dip","azimuth","rl","maxDepth"])  # Add a header row
-    for name,id,drillHoleStatus,elevation,northing,easting,longitude,latitude,dip,azimuth,rl,maxDepth in drill_holes:
-        writer.writerow([name,id,drillHoleStatus,elevation,northing,easting,longitude,latitude,dip,azimuth,rl,maxDepth])
-
-print(f"Drill holes files saved to {output_csv}")
\ No newline at end of file
+if duplicate_analysis:
+    duplicate_report = find_duplicate_images(pd.DataFrame(analysis_columns))
+    output_csv = output_dir / f"duplicate_images_{timestamp}.csv"
+    duplicate_report.to_csv(output_csv, index=False)
+    duplicate_image_count = int(duplicate_report['Count'].sum()) if len(duplicate_report) else 0
+    print(f"Found {len(duplicate_report)} groups of duplicate images ({duplicate_image_count} images) "
+          f"by drill hole, depth range, image class and standard type")
+    print(f"Duplicate images saved to {output_csv}")
+
+rollup = build_hole_rollup(pd.DataFrame(rollup_rows, columns=['ID', 'Hole Name', 'depthFrom', 'depthTo', 'standardType']),
+                           drill_holes)
+output_csv = output_dir / f"hole_rollup_{timestamp}.csv"
+rollup.to_csv(output_csv, index=False)
+print(f"{len(rollup)} drill holes, {int((rollup['Image Count'] > 0).sum())} with images, "
+      f"{int(rollup['Image Count'].sum())} images ({int(rollup['Dry Images'].sum())} Dry, {int(rollup['Wet Images'].sum())} Wet)")
+print(f"Hole rollup saved to {output_csv}")
+
+if mirror:
+    mirror.close()
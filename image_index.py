@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Depths closer than this are treated as the same box
+DEPTH_TOLERANCE = 0.0001
+
+
+def depth_bucket(value):
+    """
+    Quantize a depth value onto the DEPTH_TOLERANCE grid
+
+    Returns:
+        Integer bucket for numeric depths, or a ('raw', text) tuple when the value
+        cannot be converted to float (these only match the exact same text)
+    """
+    try:
+        return round(float(value) / DEPTH_TOLERANCE)
+    except (ValueError, TypeError):
+        return ('raw', str(value))
+
+
+def standard_type_key(value):
+    """
+    Normalize a standard type (1 for Dry, 2 for Wet) for use in an index key
+    """
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return ('raw', str(value))
+
+
+def _neighbour_buckets(bucket):
+    # Two depths within the tolerance can round into adjacent buckets
+    if isinstance(bucket, tuple):
+        return (bucket,)
+    return (bucket - 1, bucket, bucket + 1)
+
+
+def _depths_match(a, b):
+    try:
+        return abs(float(a) - float(b)) < DEPTH_TOLERANCE
+    except (ValueError, TypeError):
+        return str(a) == str(b)
+
+
+class ImageIndex:
+    """
+    Hash index of images keyed on hole name, quantized depths and standard type
+
+    Lookups check the neighbouring depth buckets and then confirm the match with
+    the same abs() < DEPTH_TOLERANCE comparison used before, so each lookup is
+    O(1) regardless of how many images are indexed.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self.count = 0
+
+    def add(self, hole_name, depth_from, depth_to, standard_type, value=None):
+        """
+        Add an image to the index
+
+        Args:
+            hole_name: Drill hole name
+            depth_from: Depth from
+            depth_to: Depth to
+            standard_type: Standard type (1 for Dry, 2 for Wet)
+            value: Optional payload returned by find() (e.g. image ID or row number)
+        """
+        key = (hole_name, depth_bucket(depth_from), depth_bucket(depth_to), standard_type_key(standard_type))
+        self._buckets.setdefault(key, []).append((depth_from, depth_to, value))
+        self.count += 1
+
+    def find_all(self, hole_name, depth_from, depth_to, standard_type):
+        """
+        Return the payloads of every indexed image matching the given fields
+        """
+        type_key = standard_type_key(standard_type)
+        matches = []
+        for from_bucket in _neighbour_buckets(depth_bucket(depth_from)):
+            for to_bucket in _neighbour_buckets(depth_bucket(depth_to)):
+                for api_from, api_to, value in self._buckets.get((hole_name, from_bucket, to_bucket, type_key), ()):
+                    if _depths_match(api_from, depth_from) and _depths_match(api_to, depth_to):
+                        matches.append(value)
+        return matches
+
+    def contains(self, hole_name, depth_from, depth_to, standard_type):
+        """
+        Check whether an image with matching hole, depth range and standard type is indexed
+        """
+        return len(self.find_all(hole_name, depth_from, depth_to, standard_type)) > 0
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from content_hash_cache import sha256_file
+
+# Pillow is only needed when IMAGE_TRANSFORM is enabled
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class ImageTransformer:
+    """
+    Re-encode images to a target JPEG quality and/or maximum dimension before upload
+
+    Results are cached on disk keyed by the source file's SHA-256 and the settings.
+    """
+
+    def __init__(self, cache_dir, quality=85, max_dimension=0, workers=None):
+        """
+        Args:
+            cache_dir: Directory for the transformed files (created if missing)
+            quality: JPEG quality of the re-encoded files (1-95)
+            max_dimension: Longest side in pixels, 0 to keep the original size
+            workers: Number of transform threads (defaults to the CPU count)
+        """
+        if Image is None:
+            raise ImportError("Pillow is required for image transforms: pip install Pillow")
+        self.cache_dir = cache_dir
+        self.quality = quality
+        self.max_dimension = max_dimension
+        os.makedirs(cache_dir, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+
+    def describe(self):
+        size = f"max {self.max_dimension}px" if self.max_dimension else "original size"
+        return f"JPEG quality {self.quality}, {size}"
+
+    def submit(self, path, source_hash=None):
+        """
+        Start transforming a file in the background
+
+        Returns:
+            Future resolving to the path of the file to upload (see transform)
+        """
+        return self.executor.submit(self.transform, path, source_hash)
+
+    def transform(self, path, source_hash=None):
+        """
+        Return the path of the file to upload in place of the source file
+
+        The cached copy is reused when it exists. The source path is returned
+        when re-encoding would not make the file smaller.
+
+        Args:
+            path: Source image path
+            source_hash: SHA-256 of the source file if already known
+        """
+        path = str(path)
+        source_hash = source_hash or sha256_file(path)
+        cached_path = os.path.join(self.cache_dir, f"{source_hash}_q{self.quality}_d{self.max_dimension}.jpg")
+        if os.path.exists(cached_path):
+            return cached_path
+        # A marker file records sources that re-encoding does not shrink
+        keep_marker = cached_path + ".keep"
+        if os.path.exists(keep_marker):
+            return path
+
+        with Image.open(path) as img:
+            exif = img.info.get('exif')
+            if self.max_dimension and max(img.size) > self.max_dimension:
+                img.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            # Write to a temporary name first so an interrupted run never leaves a partial file in the cache
+            tmp_path = f"{cached_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            save_args = {'quality': self.quality, 'optimize': True}
+            if exif:
+                save_args['exif'] = exif
+            img.save(tmp_path, 'JPEG', **save_args)
+
+        if os.path.getsize(tmp_path) >= os.path.getsize(path):
+            os.remove(tmp_path)
+            open(keep_marker, 'w').close()
+            return path
+        os.replace(tmp_path, cached_path)
+        return cached_path
+
+    def close(self):
+        self.executor.shutdown(wait=True)
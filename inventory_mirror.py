@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+# Shared by every script that reads the inventory
+DEFAULT_MIRROR_FILE = "logs/inventory_mirror.sqlite"
+
+IMAGES = 'images'
+DRILL_HOLES = 'drill_holes'
+
+# Newest records first, so an incremental sync can stop at the last record it already has
+NEWEST_FIRST = 'Id DESC'
+
+
+class InventoryMirror:
+    """
+    Local SQLite mirror of the images (with their files) and drill holes of each project and prospect
+
+    Items are stored as the JSON the API returned, plus indexed columns for
+    the lookups the scripts make (image ID, drill hole name). A sync is
+    incremental when possible: pages are requested newest first and fetching
+    stops at the newest ID already mirrored. If the server ignores the sort
+    order, or the mirrored count does not match totalCount afterwards (e.g.
+    records were deleted), or the last full sync is older than max_age, the
+    mirror is rebuilt with a full fetch. A full fetch replaces the old rows in
+    one transaction, so a failed sync leaves the previous mirror intact.
+
+    Only the thread that created the mirror may use it (sqlite3 default).
+    """
+
+    def __init__(self, client, api_endpoint, path=DEFAULT_MIRROR_FILE):
+        """
+        Args:
+            client: ApiClient used to fetch pages
+            api_endpoint: API base URL
+            path: Path of the SQLite database file (created if missing)
+        """
+        self.client = client
+        self.api_endpoint = api_endpoint
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                project_id INTEGER NOT NULL,
+                prospect_id INTEGER NOT NULL,
+                id INTEGER NOT NULL,
+                hole_name TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (project_id, prospect_id, id)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_images_hole ON images (project_id, prospect_id, hole_name)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS drill_holes (
+                project_id INTEGER NOT NULL,
+                prospect_id INTEGER NOT NULL,
+                id INTEGER NOT NULL,
+                hole_name TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (project_id, prospect_id, id)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                project_id INTEGER NOT NULL,
+                prospect_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                max_id INTEGER,
+                full_sync_at TEXT NOT NULL,
+                synced_at TEXT NOT NULL,
+                PRIMARY KEY (project_id, prospect_id, kind)
+            )
+        """)
+        self.conn.commit()
+
+    def sync_images(self, projectId, prospectId, max_age_hours=24, full=False):
+        """
+        Bring the mirrored images of a project and prospect up to date
+
+        Returns:
+            tuple: (mode 'incremental' or 'full', number of items fetched)
+        """
+        url = f"{self.api_endpoint}/services/app/Image/GetAll"
+        return self._sync(IMAGES, url, projectId, prospectId, max_age_hours, full)
+
+    def sync_drill_holes(self, projectId, prospectId, max_age_hours=24, full=False):
+        """
+        Bring the mirrored drill holes of a project and prospect up to date
+
+        Returns:
+            tuple: (mode 'incremental' or 'full', number of items fetched)
+        """
+        url = f"{self.api_endpoint}/services/app/DrillHole/GetAll"
+        return self._sync(DRILL_HOLES, url, projectId, prospectId, max_age_hours, full)
+
+    def synced_images(self, projectId, prospectId, hole_names=None, max_age_hours=24):
+        """
+        Sync the images of a project and prospect, then yield them from the mirror
+
+        The sync runs when iteration starts, so API errors are raised from the
+        caller's loop just like when paging the API directly.
+        """
+        mode, fetched = self.sync_images(projectId, prospectId, max_age_hours)
+        print(f"Inventory mirror: {mode} sync fetched {fetched} images ({self.path})")
+        yield from self.iter_images(projectId, prospectId, hole_names)
+
+    def synced_drill_holes(self, projectId, prospectId, max_age_hours=24):
+        """Sync the drill holes of a project and prospect, then yield them from the mirror"""
+        mode, fetched = self.sync_drill_holes(projectId, prospectId, max_age_hours)
+        print(f"Inventory mirror: {mode} sync fetched {fetched} drill holes ({self.path})")
+        yield from self.iter_drill_holes(projectId, prospectId)
+
+    def iter_images(self, projectId, prospectId, hole_names=None):
+        """
+        Yield mirrored image items, optionally only those of the given drill holes
+
+        Items are the JSON objects returned by Image/GetAll, in ID order.
+        """
+        if hole_names is None:
+            rows = self.conn.execute("SELECT data FROM images WHERE project_id = ? AND prospect_id = ? ORDER BY id",
+                                     (projectId, prospectId))
+        else:
+            names = list(dict.fromkeys(str(name) for name in hole_names))
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted_holes (name TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM wanted_holes")
+            self.conn.executemany("INSERT OR IGNORE INTO wanted_holes (name) VALUES (?)", ((name,) for name in names))
+            rows = self.conn.execute(
+                "SELECT data FROM images WHERE project_id = ? AND prospect_id = ? "
+                "AND hole_name IN (SELECT name FROM wanted_holes) ORDER BY id",
+                (projectId, prospectId)
+            ).fetchall()
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def iter_drill_holes(self, projectId, prospectId):
+        """Yield mirrored drill hole items, in ID order"""
+        rows = self.conn.execute("SELECT data FROM drill_holes WHERE project_id = ? AND prospect_id = ? ORDER BY id",
+                                 (projectId, prospectId))
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def _sync(self, kind, url, projectId, prospectId, max_age_hours, full):
+        params = {'ProjectIds': projectId, 'ProspectIds': prospectId}
+        state = self.conn.execute(
+            "SELECT max_id, full_sync_at FROM sync_state WHERE project_id = ? AND prospect_id = ? AND kind = ?",
+            (projectId, prospectId, kind)
+        ).fetchone()
+        stale = state is None or datetime.fromisoformat(state[1]) < datetime.now() - timedelta(hours=max_age_hours)
+        if not full and not stale:
+            new_items = self._fetch_newer(url, params, state[0])
+            if new_items is not None:
+                new_items, total_count = new_items
+                mirrored = self.conn.execute(f"SELECT COUNT(*) FROM {kind} WHERE project_id = ? AND prospect_id = ?",
+                                             (projectId, prospectId)).fetchone()[0]
+                if mirrored + len(new_items) == total_count:
+                    with self.conn:
+                        self._insert(kind, projectId, prospectId, new_items)
+                        max_id = max([item['id'] for item in new_items] + [state[0] or 0])
+                        self.conn.execute(
+                            "UPDATE sync_state SET max_id = ?, synced_at = ? WHERE project_id = ? AND prospect_id = ? AND kind = ?",
+                            (max_id, datetime.now().isoformat(timespec='seconds'), projectId, prospectId, kind)
+                        )
+                    return 'incremental', len(new_items)
+
+        # Full refresh, replacing the old rows only once every page has arrived
+        now = datetime.now().isoformat(timespec='seconds')
+        fetched = 0
+        max_id = None
+        with self.conn:
+            self.conn.execute(f"DELETE FROM {kind} WHERE project_id = ? AND prospect_id = ?", (projectId, prospectId))
+            for page in self.client.get_pages(url, params=params):
+                items = page['items']
+                self._insert(kind, projectId, prospectId, items)
+                fetched += len(items)
+                ids = [item['id'] for item in items if item.get('id') is not None]
+                if ids:
+                    max_id = max(ids + [max_id or 0])
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_state (project_id, prospect_id, kind, max_id, full_sync_at, synced_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (projectId, prospectId, kind, max_id, now, now)
+            )
+        return 'full', fetched
+
+    def _fetch_newer(self, url, params, max_id):
+        """
+        Fetch the items with an ID above max_id, newest first
+
+        Returns:
+            tuple: (new items, server totalCount), or None when the server did
+            not return the items newest first and a full sync is needed
+        """
+        new_items = []
+        skip = 0
+        page_size = self.client.auth_config['page_size']
+        while True:
+            result = self.client.get_page(url, dict(params, Sorting=NEWEST_FIRST), skip, page_size)
+            items = result['items']
+            ids = [item.get('id') for item in items]
+            if None in ids or ids != sorted(ids, reverse=True):
+                return None
+            newer = [item for item in items if max_id is None or item['id'] > max_id]
+            new_items.extend(newer)
+            skip += len(items)
+            if len(newer) < len(items) or not items or skip >= result['totalCount']:
+                return new_items, result['totalCount']
+
+    def _insert(self, kind, projectId, prospectId, items):
+        if kind == IMAGES:
+            hole_name = lambda item: (item.get('drillHole') or {}).get('name')
+        else:
+            hole_name = lambda item: item.get('name')
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {kind} (project_id, prospect_id, id, hole_name, data) VALUES (?, ?, ?, ?, ?)",
+            ((projectId, prospectId, item['id'], hole_name(item), json.dumps(item)) for item in items)
+        )
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ManifestRow = namedtuple('ManifestRow', [
+    'index', 'line_number', 'hole_name', 'depth_from', 'depth_to', 'image_type',
+    'standard_type', 'original_filename', 'full_path', 'problem'
+])
+
+TEXT_COLUMNS = ['HoleID', 'ImageType', 'Original Filename', 'Full Path']
+
+
+def _list_directory(directory):
+    try:
+        names = os.listdir(directory or '.')
+    except OSError:
+        return set()
+    # Windows file names are case-insensitive
+    return {os.path.normcase(name) for name in names}
+
+
+def find_missing_files(paths, workers=8):
+    """
+    Check which files do not exist, listing each directory once instead of stat-ing every file
+
+    Args:
+        paths: Array of file paths
+        workers: Number of threads listing directories (helps on network drives)
+
+    Returns:
+        Boolean numpy array, True where the file is missing
+    """
+    paths = pd.Series(paths, dtype=object).fillna('').astype(str)
+    directories = paths.map(os.path.dirname)
+    names = paths.map(os.path.basename).map(os.path.normcase)
+    unique_directories = directories.unique()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        listings = dict(zip(unique_directories, executor.map(_list_directory, unique_directories)))
+    present = [name in listings[directory] for directory, name in zip(directories, names)]
+    return ~np.array(present, dtype=bool) | (names == '').to_numpy()
+
+
+class Manifest:
+    """
+    Validated, typed columns of a filestoupload.csv manifest
+
+    All parsing and validation is done column-wise with pandas/numpy:
+    ImageType is normalized to a standard type (1 for Dry, 2 for Wet),
+    BoxFrom/BoxTo are coerced to floats, and rows with missing depths, a
+    missing hole name or a missing file get a problem description. Rows with
+    BoxTo <= BoxFrom are flagged but still uploaded.
+    """
+
+    def __init__(self, df, stat_workers=8):
+        """
+        The source DataFrame is kept as .frame so subsets can be written back
+        out in the manifest's own columns.
+
+        Args:
+            df: DataFrame read from the manifest CSV
+            stat_workers: Number of threads used to check the files exist
+        """
+        self.frame = df
+        self.count = len(df)
+        self.line_number = np.arange(2, self.count + 2)  # +2 for the 0-based index and the header row
+        self.hole_name = df['HoleID'].fillna('').astype(str).str.strip().to_numpy()
+        self.depth_from = pd.to_numeric(df['BoxFrom'], errors='coerce').to_numpy(dtype=float)
+        self.depth_to = pd.to_numeric(df['BoxTo'], errors='coerce').to_numpy(dtype=float)
+        image_type = df['ImageType'].fillna('').astype(str).str.strip()
+        self.image_type = image_type.to_numpy()
+        self.standard_type = np.where(image_type.str.lower() == 'dry', 1, 2).astype(np.int8)
+        self.full_path = df['Full Path'].fillna('').astype(str).to_numpy()
+        if 'Original Filename' in df:
+            self.original_filename = df['Original Filename'].fillna('').astype(str).to_numpy()
+        else:
+            self.original_filename = np.array([os.path.basename(p) for p in self.full_path], dtype=object)
+
+        self.missing_hole = self.hole_name == ''
+        self.invalid_depth = np.isnan(self.depth_from) | np.isnan(self.depth_to)
+        self.reversed_range = ~self.invalid_depth & (self.depth_to <= self.depth_from)
+        self.missing_file = find_missing_files(self.full_path, stat_workers)
+
+        problems = np.full(self.count, None, dtype=object)
+        problems[self.missing_file] = "File not found"
+        problems[self.invalid_depth] = "BoxFrom/BoxTo is not a number"
+        problems[self.missing_hole] = "HoleID is empty"
+        self.problem = problems
+        self.invalid = self.missing_hole | self.invalid_depth | self.missing_file
+
+    def __len__(self):
+        return self.count
+
+    def rows(self):
+        """Yield a ManifestRow for each row, in manifest order"""
+        # tolist() turns the numpy scalars into plain Python values in one pass
+        columns = (range(self.count), self.line_number.tolist(), self.hole_name.tolist(),
+                   self.depth_from.tolist(), self.depth_to.tolist(), self.image_type.tolist(),
+                   self.standard_type.tolist(), self.original_filename.tolist(), self.full_path.tolist(),
+                   self.problem.tolist())
+        for values in zip(*columns):
+            yield ManifestRow(*values)
+
+    def rows_where(self, mask):
+        """Return the ManifestRows selected by a boolean mask"""
+        return [row for row, selected in zip(self.rows(), mask.tolist()) if selected]
+
+    def hole_names(self):
+        """Return the sorted unique drill hole names of the rows that passed validation"""
+        return sorted(set(self.hole_name[~self.invalid].tolist()))
+
+    def summary(self):
+        """Return a dict of validation counts"""
+        return {
+            'rows': self.count,
+            'missing_hole': int(self.missing_hole.sum()),
+            'invalid_depth': int(self.invalid_depth.sum()),
+            'reversed_range': int(self.reversed_range.sum()),
+            'missing_file': int(self.missing_file.sum()),
+        }
+
+
+def load_manifest(path, stat_workers=8):
+    """
+    Read and validate a filestoupload.csv manifest
+
+    Returns:
+        Manifest
+    """
+    df = pd.read_csv(path, dtype={column: str for column in TEXT_COLUMNS}, keep_default_na=False)
+    return Manifest(df, stat_workers)
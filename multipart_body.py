@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import uuid
+
+# Largest block read from an image file at a time
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def _quote_param(value):
+    # Same escaping browsers (and urllib3) use for multipart header parameters
+    return str(value).replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+class StreamingMultipartBody:
+    """
+    multipart/form-data request body that streams files from disk
+
+    The text fields and part headers are built up front, but file contents are
+    read in chunks only as the connection sends them, so memory per upload is
+    bounded by the send buffer rather than the file size. The total length is
+    known in advance, so requests sends a normal Content-Length header.
+
+    Each file is opened when its part is reached and closed as soon as it has
+    been sent; close() (or leaving a with block) releases any file still open,
+    e.g. after a failed request. seek(0) rewinds the body so it can be sent
+    again on a retry.
+    """
+
+    def __init__(self, fields, boundary=None):
+        """
+        Args:
+            fields: dict of name -> (filename, value, [content_type]) in the same
+                    shape as a requests files= dict. With filename None, value is
+                    the text of the field; otherwise value is the path of the
+                    file to stream.
+            boundary: Optional multipart boundary (random by default)
+        """
+        self.boundary = boundary or uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._segments = []
+        for name, spec in fields.items():
+            filename, value = spec[0], spec[1]
+            header = f"--{self.boundary}\r\nContent-Disposition: form-data; name=\"{_quote_param(name)}\""
+            if filename is None:
+                self._segments.append((header + f"\r\n\r\n{value}\r\n").encode('utf-8'))
+            else:
+                content_type = spec[2] if len(spec) > 2 else 'application/octet-stream'
+                header += f"; filename=\"{_quote_param(filename)}\"\r\nContent-Type: {content_type}\r\n\r\n"
+                self._segments.append(header.encode('utf-8'))
+                self._segments.append((str(value), os.path.getsize(value)))
+                self._segments.append(b"\r\n")
+        self._segments.append(f"--{self.boundary}--\r\n".encode('utf-8'))
+        self._length = sum(len(s) if isinstance(s, bytes) else s[1] for s in self._segments)
+        self.seek(0)
+
+    def __len__(self):
+        return self._length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        """Rewind the body; only seeking back to the start is supported"""
+        if offset != 0 or whence != 0:
+            raise OSError("StreamingMultipartBody can only be rewound to the start")
+        self.close()
+        self._index = 0
+        self._offset = 0
+        self._position = 0
+        return 0
+
+    def read(self, size=-1):
+        """Return up to size bytes of the body (the rest of it if size is negative)"""
+        if size is None or size < 0:
+            size = self._length - self._position
+        chunks = []
+        remaining = size
+        while remaining > 0 and self._index < len(self._segments):
+            segment = self._segments[self._index]
+            if isinstance(segment, bytes):
+                chunk = segment[self._offset:self._offset + remaining]
+                self._offset += len(chunk)
+                done = self._offset >= len(segment)
+            else:
+                if self._file is None:
+                    self._file = open(segment[0], 'rb')
+                chunk = self._file.read(min(remaining, READ_CHUNK_SIZE))
+                self._offset += len(chunk)
+                done = not chunk or self._offset >= segment[1]
+                if done:
+                    self._file.close()
+                    self._file = None
+            if done:
+                self._index += 1
+                self._offset = 0
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        data = b"".join(chunks)
+        self._position += len(data)
+        return data
+
+    def close(self):
+        """Close the file currently being streamed, if any"""
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
+        self._file = None
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import queue
+import threading
+from datetime import datetime
+
+import requests
+
+from concurrency import TokenBucket
+
+
+def process_image(client, api_endpoint, image_id, workflow_id):
+    """
+    Process an image with the specified workflow
+    Returns:
+        - On success: Tuple(response, None)
+        - On failure: Tuple(None, error_details)
+    """
+    url = f"{api_endpoint}/services/app/Image/ProcessImage"
+
+    payload = json.dumps({
+        "imageId": image_id,
+        "workflowId": workflow_id
+    })
+
+    error_details = {
+        'error_type': None,
+        'error_message': None,
+        'status_code': None,
+        'response_content': None,
+        'request_url': url,
+        'request_payload': payload
+    }
+
+    try:
+        response = client.request("POST", url, data=payload, timeout=30)
+        response.raise_for_status()
+        return response, None
+
+    except requests.exceptions.Timeout:
+        error_details.update({
+            'error_type': 'Timeout',
+            'error_message': f"Request timed out after 30 seconds for image {image_id}"
+        })
+        return None, error_details
+
+    except requests.exceptions.ConnectionError as e:
+        error_details.update({
+            'error_type': 'ConnectionError',
+            'error_message': f"Connection failed for image {image_id}: {str(e)}"
+        })
+        return None, error_details
+
+    except requests.exceptions.HTTPError as e:
+        error_details.update({
+            'error_type': 'HTTPError',
+            'error_message': f"HTTP error occurred for image {image_id}: {str(e)}",
+            'status_code': e.response.status_code,
+            'response_content': e.response.text
+        })
+        return None, error_details
+
+    except requests.exceptions.RequestException as e:
+        error_details.update({
+            'error_type': 'RequestException',
+            'error_message': f"Request failed for image {image_id}: {str(e)}"
+        })
+        if hasattr(e, 'response') and e.response is not None:
+            error_details.update({
+                'status_code': e.response.status_code,
+                'response_content': e.response.text
+            })
+        return None, error_details
+
+
+class ProcessPipeline:
+    """
+    Send ProcessImage for image IDs as they are queued, on background worker threads
+
+    The uploader calls submit() as soon as Image/Create returns an image ID, so
+    workflows start while the remaining files are still uploading. Requests are
+    paced with a TokenBucket shared by all workers, as in execute_batch.py.
+    Finished requests are collected with completed() and, after close(), all
+    remaining ones.
+    """
+
+    def __init__(self, client, api_endpoint, workflow_id, workers=4, rate=0):
+        """
+        Args:
+            client: ApiClient used for the requests
+            api_endpoint: API base URL
+            workflow_id: Workflow to run on each image
+            workers: Number of ProcessImage requests in flight at once
+            rate: Maximum ProcessImage requests per second (0 for no limit)
+        """
+        self.client = client
+        self.api_endpoint = api_endpoint
+        self.workflow_id = workflow_id
+        self.rate_limiter = TokenBucket(rate)
+        self._queue = queue.Queue()
+        self._results = queue.Queue()
+        self._threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, image_id, info=None):
+        """
+        Queue an image for processing
+
+        Args:
+            image_id: ID of the uploaded image
+            info: Optional dict returned with the result (e.g. filename, hole, depths)
+        """
+        self._queue.put((image_id, info or {}))
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            image_id, info = job
+            self.rate_limiter.acquire()
+            try:
+                response, error_details = process_image(self.client, self.api_endpoint, image_id, self.workflow_id)
+            except Exception as e:
+                response, error_details = None, {
+                    'error_type': type(e).__name__,
+                    'error_message': f"Unexpected error for image {image_id}: {str(e)}",
+                    'status_code': None,
+                    'response_content': None,
+                    'request_url': f"{self.api_endpoint}/services/app/Image/ProcessImage",
+                    'request_payload': None
+                }
+            finished_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self._results.put((image_id, info, response, error_details, finished_at))
+
+    def completed(self):
+        """
+        Return the results finished so far without waiting
+
+        Returns:
+            List of (image_id, info, response, error_details, finished_at) tuples
+        """
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def close(self):
+        """
+        Wait for every queued image to be processed and stop the workers
+
+        Returns:
+            The results not yet collected with completed()
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        return self.completed()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sqlite3
+from datetime import datetime
+
+PROCESSED = 'processed'
+FAILED = 'failed'
+
+# Shared by execute_batch.py and the PROCESS_AFTER_UPLOAD mode of upload_image.py
+DEFAULT_STATE_FILE = "logs/execute_batch/process_state.sqlite"
+
+
+class ProcessState:
+    """
+    Local SQLite record of which images were sent to which workflow
+
+    One row per (image ID, workflow ID) with the status of the last
+    ProcessImage request and when it finished, so later runs can skip images
+    that were already processed with the same workflow.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_FILE):
+        """
+        Args:
+            path: Path of the SQLite database file (created if missing)
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS processed_images (
+                image_id INTEGER NOT NULL,
+                workflow_id INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (image_id, workflow_id)
+            )
+        """)
+        self.conn.commit()
+
+    def processed_ids(self, workflow_id):
+        """Return the set of image IDs already processed successfully with the workflow"""
+        rows = self.conn.execute("SELECT image_id FROM processed_images WHERE workflow_id = ? AND status = ?",
+                                 (workflow_id, PROCESSED)).fetchall()
+        return {row[0] for row in rows}
+
+    def record(self, image_id, workflow_id, status, timestamp=None):
+        """Record the outcome of a ProcessImage request and commit it straight away"""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO processed_images (image_id, workflow_id, status, updated_at) VALUES (?, ?, ?, ?)",
+                (image_id, workflow_id, status, timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+
+    def close(self):
+        self.conn.close()
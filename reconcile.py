@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# coding: utf-8
+
+# %%
+import csv
+import pandas as pd
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+from authentication import init_auth, authenticate, ApiClient, ApiResponseError
+from manifest import load_manifest
+from image_index import ImageIndex, DEPTH_TOLERANCE
+from depth_intervals import find_reference_overlaps
+from inventory_mirror import InventoryMirror
+
+# Initialize authentication
+auth_config = init_auth()
+projectId = auth_config['projectId']
+prospectId = auth_config['prospectId']
+api_endpoint = auth_config['api_endpoint']
+use_credentials = auth_config['use_credentials']
+
+timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+output_dir = Path("logs/reconcile")
+output_dir.mkdir(parents=True, exist_ok=True)
+
+SERVER_ONLY_COLUMNS = ['Image ID', 'HoleID', 'depthFrom', 'depthTo', 'standardType', 'File Name']
+
+
+# %%
+def get_all_images(client, mirror):
+    """
+    Stream all images for the project and prospect, fetched page by page (or from the inventory mirror)
+    """
+    if mirror:
+        return mirror.synced_images(projectId, prospectId, max_age_hours=auth_config['mirror_max_age_hours'])
+    url = f"{api_endpoint}/services/app/Image/GetAll"
+    return client.iter_items(url, params={'ProjectIds': projectId, 'ProspectIds': prospectId})
+
+
+def reconcile(manifest, inventory, server_only_file):
+    """
+    Hash-join the manifest against the server inventory in one pass over the inventory
+
+    The manifest (the smaller side) is indexed on hole, quantized depths and
+    standard type. Server images are streamed through the index: matches mark
+    manifest rows as already present, and unmatched images are written to
+    server_only_file straight away, so memory does not grow with the
+    inventory. Only the depth ranges of server images in the manifest's drill
+    holes are kept, for the conflicting-depth check.
+
+    Returns:
+        tuple: (array of matching server image IDs per manifest row (0 if none),
+                DataFrame of server boxes in the manifest's holes,
+                number of server images, number of server-only images)
+    """
+    valid_rows = ~manifest.invalid
+    index = ImageIndex()
+    for row in manifest.rows_where(valid_rows):
+        index.add(row.hole_name, row.depth_from, row.depth_to, row.standard_type, row.index)
+    manifest_holes = set(manifest.hole_names())
+
+    present_image_id = np.zeros(len(manifest), dtype=np.int64)
+    server_boxes = []
+    server_count = 0
+    server_only_count = 0
+    with open(server_only_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(SERVER_ONLY_COLUMNS)
+        for item in inventory:
+            server_count += 1
+            hole_name = (item.get('drillHole') or {}).get('name')
+            depth_from, depth_to, standard_type = item.get('depthFrom'), item.get('depthTo'), item.get('standardType')
+            matches = index.find_all(hole_name, depth_from, depth_to, standard_type) if hole_name else []
+            for position in matches:
+                present_image_id[position] = item.get('id') or 0
+            if not matches:
+                server_only_count += 1
+                files = item.get('files') or []
+                writer.writerow([item.get('id'), hole_name, depth_from, depth_to, standard_type,
+                                 files[0].get('fileName') if files else ''])
+            if hole_name in manifest_holes:
+                server_boxes.append((hole_name, standard_type, depth_from, depth_to))
+
+    server_boxes = pd.DataFrame(server_boxes, columns=['hole_name', 'standard_type', 'depth_from', 'depth_to'])
+    for column in ['standard_type', 'depth_from', 'depth_to']:
+        server_boxes[column] = pd.to_numeric(server_boxes[column], errors='coerce')
+    return present_image_id, server_boxes.dropna(), server_count, server_only_count
+
+
+# %%
+def main():
+    manifest = load_manifest('filestoupload.csv')
+    print(f"Loaded {len(manifest)} manifest rows from filestoupload.csv")
+
+    token = authenticate(auth_config)
+    if token is None and use_credentials:
+        print("Authentication failed. Please check your credentials and try again.")
+        exit(1)
+    client = ApiClient(auth_config, token)
+    mirror = InventoryMirror(client, api_endpoint) if auth_config['inventory_mirror'] else None
+
+    files = {name: output_dir / f"{name}_{timestamp}.csv"
+             for name in ['to_upload', 'already_present', 'server_only', 'conflicting_depth', 'invalid_rows']}
+    print("Reconciling against the server inventory...")
+    try:
+        present_image_id, server_boxes, server_count, server_only_count = reconcile(
+            manifest, get_all_images(client, mirror), files['server_only'])
+    except ApiResponseError as e:
+        print(f"ERROR: {str(e)}")
+        exit(1)
+
+    present = present_image_id != 0
+    missing = ~manifest.invalid & ~present
+    # Rows not on the server whose depth range overlaps a server box of the same hole and type
+    candidates = pd.DataFrame({
+        'hole_name': manifest.hole_name[missing],
+        'standard_type': manifest.standard_type[missing].astype(int),
+        'depth_from': manifest.depth_from[missing],
+        'depth_to': manifest.depth_to[missing],
+    })
+    conflicting = np.zeros(len(manifest), dtype=bool)
+    conflicting[np.flatnonzero(missing)] = find_reference_overlaps(candidates, server_boxes)
+    to_upload = missing & ~conflicting
+
+    # to_upload keeps the manifest's own columns, so it can be used as filestoupload.csv
+    manifest.frame[to_upload].to_csv(files['to_upload'], index=False)
+    manifest.frame[present].assign(**{'Image ID': present_image_id[present]}).to_csv(files['already_present'], index=False)
+    manifest.frame[conflicting].to_csv(files['conflicting_depth'], index=False)
+    manifest.frame[manifest.invalid].assign(Problem=manifest.problem[manifest.invalid]).to_csv(files['invalid_rows'], index=False)
+
+    print(f"\n=== Reconciliation (depth tolerance {DEPTH_TOLERANCE}) ===")
+    print(f"Manifest rows: {len(manifest)}, server images: {server_count}")
+    print(f"To upload: {int(to_upload.sum())} -> {files['to_upload']}")
+    print(f"Already present: {int(present.sum())} -> {files['already_present']}")
+    print(f"Conflicting depths: {int(conflicting.sum())} -> {files['conflicting_depth']}")
+    print(f"Server only: {server_only_count} -> {files['server_only']}")
+    print(f"Invalid manifest rows: {int(manifest.invalid.sum())} -> {files['invalid_rows']}")
+
+    if mirror:
+        mirror.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# coding: utf-8
+
+# %%
+import argparse
+import csv
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Only the scan settings are read from .env: the scan never contacts the API, so no credentials are needed
+load_dotenv(Path(__file__).parent.absolute() / '.env', override=True)
+scan_root = os.getenv('SCAN_ROOT', '.')
+scan_workers = max(1, int(os.getenv('SCAN_WORKERS', '8')))
+scan_incremental = os.getenv('SCAN_INCREMENTAL', 'false').strip().lower() == 'true'
+
+# Columns of filestoupload.csv, in the order upload_image.py expects
+MANIFEST_COLUMNS = ['HoleID', 'BoxFrom', 'BoxTo', 'Length', 'ImageType', 'OriginalFrom', 'OriginalTo',
+                    'Validation', 'Original Filename', 'Full Path']
+
+# e.g. KA-022_168.35_171.15_Dry_full.jpg -> hole KA-022, 168.35 - 171.15, Dry
+IMAGE_NAME_PATTERN = re.compile(
+    r'^(?P<hole>.+?)_(?P<from>\d+(?:\.\d+)?)_(?P<to>\d+(?:\.\d+)?)_(?P<type>dry|wet)(?:_[^.]*)?'
+    r'\.(?:jpe?g|png|tiff?|bmp)$',
+    re.IGNORECASE
+)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp')
+
+output_dir = Path("logs/scan_images")
+output_dir.mkdir(parents=True, exist_ok=True)
+cache_file = output_dir / "scan_cache.json"
+
+
+# %%
+def parse_image_name(name):
+    """
+    Parse the drill hole, depth range and image type from an image file name
+
+    Returns:
+        dict with HoleID, BoxFrom, BoxTo, Length and ImageType, or None if the
+        name does not follow the <hole>_<from>_<to>_<Dry|Wet>[_suffix].<ext> pattern
+    """
+    match = IMAGE_NAME_PATTERN.match(name)
+    if not match:
+        return None
+    depth_from = float(match.group('from'))
+    depth_to = float(match.group('to'))
+    return {
+        'HoleID': match.group('hole'),
+        'BoxFrom': depth_from,
+        'BoxTo': depth_to,
+        'Length': round(depth_to - depth_from, 4),
+        'ImageType': match.group('type').capitalize(),
+    }
+
+
+def list_directory(path):
+    """
+    List one directory with os.scandir
+
+    Returns:
+        tuple: (mtime_ns, sorted subdirectory names, sorted image file names)
+    """
+    subdirs = []
+    files = []
+    mtime_ns = os.stat(path).st_mtime_ns
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                files.append(entry.name)
+    return mtime_ns, sorted(subdirs), sorted(files)
+
+
+def scan_directory(path, cached):
+    """
+    List a directory, reusing the cached listing if its mtime has not changed
+
+    A directory's mtime changes whenever entries are added, removed or renamed
+    in it, so an unchanged mtime means the cached listing is still accurate.
+
+    Returns:
+        tuple: (listing dict with mtime_ns/subdirs/files, True if the directory was re-listed)
+    """
+    if cached is not None:
+        if os.stat(path).st_mtime_ns == cached['mtime_ns']:
+            return cached, False
+    mtime_ns, subdirs, files = list_directory(path)
+    return {'mtime_ns': mtime_ns, 'subdirs': subdirs, 'files': files}, True
+
+
+def walk_tree(root, workers, cache):
+    """
+    Walk the directory tree with a pool of threads, one directory per task
+
+    Args:
+        root: Top directory of the image tree
+        workers: Number of directories listed concurrently
+        cache: dict of directory path -> listing from an earlier scan (empty for a full scan)
+
+    Returns:
+        tuple: (dict of directory path -> listing, number of directories re-listed, list of errors)
+    """
+    listings = {}
+    errors = []
+    rescanned = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(scan_directory, root, cache.get(root)): root}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    listing, relisted = future.result()
+                except OSError as e:
+                    errors.append(f"{path}: {str(e)}")
+                    continue
+                listings[path] = listing
+                rescanned += relisted
+                for name in listing['subdirs']:
+                    subdir = os.path.join(path, name)
+                    pending[executor.submit(scan_directory, subdir, cache.get(subdir))] = subdir
+    return listings, rescanned, errors
+
+
+def load_scan_cache(root):
+    """Load the directory listings of the last scan of the same root, if any"""
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return cache['directories'] if cache.get('root') == root else {}
+
+
+def save_scan_cache(root, listings):
+    """Save the directory listings for the next incremental scan"""
+    with open(cache_file, 'w', encoding='utf-8') as f:
+        json.dump({'root': root, 'directories': listings}, f)
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser(description="Write an upload manifest from a folder of images named <hole>_<from>_<to>_<Dry|Wet>")
+    parser.add_argument('-o', '--output', default='filestoupload.csv',
+                        help="Manifest file to write (default: filestoupload.csv)")
+    parser.add_argument('--overwrite', action='store_true',
+                        help="Replace the output file if it already exists")
+    args = parser.parse_args()
+    if os.path.exists(args.output) and not args.overwrite:
+        print(f"ERROR: {args.output} already exists. Use --overwrite to replace it, or --output to write elsewhere.")
+        exit(1)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    cache = load_scan_cache(scan_root) if scan_incremental else {}
+    mode = "incremental" if cache else "full"
+    print(f"Scanning {scan_root} ({mode} scan) with {scan_workers} worker(s)...")
+
+    listings, rescanned, errors = walk_tree(scan_root, scan_workers, cache)
+    print(f"Listed {rescanned} of {len(listings)} directories ({len(listings) - rescanned} unchanged since the last scan)")
+    for error in errors:
+        print(f"WARNING: Could not read directory {error}")
+
+    rows = []
+    unparsed = []
+    for directory, listing in listings.items():
+        for name in listing['files']:
+            # Normalised so a scan of '.' gives the same paths (and journal/cache keys) as a hand-built manifest
+            full_path = os.path.normpath(os.path.join(directory, name))
+            parsed = parse_image_name(name)
+            if parsed is None:
+                unparsed.append(full_path)
+                continue
+            parsed.update({'OriginalFrom': '', 'OriginalTo': '', 'Validation': '',
+                           'Original Filename': name, 'Full Path': full_path})
+            rows.append(parsed)
+
+    # Same order as a hand-built manifest: by hole, then depth, then image type
+    rows.sort(key=lambda row: (row['HoleID'], row['BoxFrom'], row['BoxTo'], row['ImageType'], row['Full Path']))
+    with open(args.output, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Wrote {len(rows)} images from {len(set(row['HoleID'] for row in rows))} drill holes to {args.output}")
+
+    if unparsed:
+        unparsed_file = output_dir / f"unparsed_files_{timestamp}.csv"
+        with open(unparsed_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Full Path'])
+            writer.writerows([path] for path in sorted(unparsed))
+        print(f"WARNING: {len(unparsed)} image files did not match <hole>_<from>_<to>_<Dry|Wet>. Listed in: {unparsed_file}")
+
+    save_scan_cache(scan_root, listings)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import authentication
+from authentication import ApiClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Rejects the first POST with the status in server.reject_status, then echoes the JSON body"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.bodies.append(body)
+        if len(self.server.bodies) == 1:
+            self.send_response(self.server.reject_status)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        payload = json.dumps({'result': json.loads(body)}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_config(api_endpoint, **overrides):
+    config = {
+        'api_endpoint': api_endpoint,
+        'api_key': 'key',
+        'use_api_key': True,
+        'use_credentials': False,
+        'username': None,
+        'password': None,
+        'http_pool_size': 2,
+        'adaptive_rate': False,
+        'rate_retries': 3,
+        'token_cache': False,
+        'token_refresh_margin': 300,
+    }
+    config.update(overrides)
+    return config
+
+
+class ApiClientRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.bodies = []
+        self.server.reject_status = 429
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_endpoint = f"http://127.0.0.1:{self.server.server_port}/api"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_rate_limited_json_post_is_retried(self):
+        client = ApiClient(make_config(self.api_endpoint, adaptive_rate=True))
+        payload = json.dumps({'imageId': 1, 'workflowId': 2})
+        response = client.request('POST', f"{self.api_endpoint}/services/app/Image/ProcessImage", data=payload)
+        client.close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['result'], {'imageId': 1, 'workflowId': 2})
+        self.assertEqual(len(self.server.bodies), 2)
+
+    def test_unauthorized_json_post_is_retried_with_new_token(self):
+        self.server.reject_status = 401
+        config = make_config(self.api_endpoint, api_key=None, use_api_key=False, use_credentials=True,
+                             username='user', password='password')
+        client = ApiClient(config, 'expired')
+        original_authenticate = authentication.authenticate
+        authentication.authenticate = lambda auth_config, stale_token=None: 'renewed'
+        try:
+            payload = json.dumps({'imageId': 1, 'workflowId': 2})
+            response = client.request('POST', f"{self.api_endpoint}/services/app/Image/ProcessImage", data=payload)
+        finally:
+            authentication.authenticate = original_authenticate
+            client.close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.access_token, 'renewed')
+        self.assertEqual(len(self.server.bodies), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from depth_intervals import find_depth_issues, find_reference_overlaps
+
+
+def make_intervals(*boxes):
+    """Build intervals from (hole_name, standard_type, depth_from, depth_to, label, from_manifest) tuples"""
+    return pd.DataFrame(boxes, columns=['hole_name', 'standard_type', 'depth_from', 'depth_to', 'label', 'from_manifest'])
+
+
+class FindDepthIssuesTest(unittest.TestCase):
+
+    def test_contiguous_boxes_have_no_issues(self):
+        intervals = make_intervals(
+            ('DH-1', 1, 0.0, 2.5, 'line 2', True),
+            ('DH-1', 1, 2.5, 5.0, 'line 3', True),
+            ('DH-1', 1, 5.00005, 7.0, 'line 4', True),
+        )
+        self.assertTrue(find_depth_issues(intervals).empty)
+
+    def test_overlap_and_gap_are_reported(self):
+        intervals = make_intervals(
+            ('DH-1', 1, 2.0, 4.0, 'line 3', True),
+            ('DH-1', 1, 0.0, 2.5, 'line 2', True),
+            ('DH-1', 1, 5.0, 6.0, 'line 4', True),
+        )
+        issues = find_depth_issues(intervals)
+
+        self.assertEqual(issues['Issue'].tolist(), ['overlap', 'gap'])
+        self.assertEqual(issues[['From', 'To']].values.tolist(), [[2.0, 2.5], [4.0, 5.0]])
+        self.assertEqual(issues[['First', 'Second']].values.tolist(), [['line 2', 'line 3'], ['line 3', 'line 4']])
+
+    def test_box_is_compared_with_the_deepest_earlier_box(self):
+        # line 3 lies inside line 2, so line 4 starting at 10 leaves no gap
+        intervals = make_intervals(
+            ('DH-1', 1, 0.0, 10.0, 'line 2', True),
+            ('DH-1', 1, 2.0, 3.0, 'line 3', True),
+            ('DH-1', 1, 10.0, 12.0, 'line 4', True),
+        )
+        issues = find_depth_issues(intervals)
+
+        self.assertEqual(issues['Issue'].tolist(), ['overlap'])
+        self.assertEqual(issues[['First', 'Second']].values.tolist(), [['line 2', 'line 3']])
+
+    def test_holes_and_image_types_are_checked_separately(self):
+        intervals = make_intervals(
+            ('DH-1', 1, 0.0, 2.0, 'line 2', True),
+            ('DH-1', 2, 1.0, 3.0, 'line 3', True),
+            ('DH-2', 1, 5.0, 6.0, 'line 4', True),
+        )
+        self.assertTrue(find_depth_issues(intervals).empty)
+
+    def test_duplicates_and_server_only_issues_are_not_reported(self):
+        intervals = make_intervals(
+            ('DH-1', 1, 0.0, 2.0, 'server image 1', False),
+            ('DH-1', 1, 0.0, 2.0, 'line 2', True),
+            ('DH-1', 1, 1.0, 3.0, 'server image 2', False),
+        )
+        self.assertTrue(find_depth_issues(intervals).empty)
+
+    def test_manifest_box_overlapping_a_server_box_is_reported(self):
+        intervals = make_intervals(
+            ('DH-1', 1, 0.0, 2.0, 'server image 1', False),
+            ('DH-1', 1, 1.5, 3.0, 'line 2', True),
+        )
+        issues = find_depth_issues(intervals)
+
+        self.assertEqual(issues[['Issue', 'First', 'Second']].values.tolist(), [['overlap', 'server image 1', 'line 2']])
+
+
+class FindReferenceOverlapsTest(unittest.TestCase):
+
+    def test_overlaps_are_flagged_per_hole_and_image_type(self):
+        reference = pd.DataFrame({
+            'hole_name': ['DH-1', 'DH-1'],
+            'standard_type': [1, 1],
+            'depth_from': [0.0, 10.0],
+            'depth_to': [5.0, 12.0],
+        })
+        intervals = pd.DataFrame({
+            'hole_name': ['DH-1', 'DH-1', 'DH-1', 'DH-1', 'DH-2'],
+            'standard_type': [1, 1, 1, 2, 1],
+            'depth_from': [4.0, 5.0, 6.0, 1.0, 1.0],
+            'depth_to': [6.0, 10.0, 11.0, 2.0, 2.0],
+        }, index=[10, 20, 30, 40, 50])
+
+        overlaps = find_reference_overlaps(intervals, reference)
+
+        # Boxes touching at 5.0 and 10.0 do not overlap
+        np.testing.assert_array_equal(overlaps, [True, False, True, False, False])
+
+    def test_empty_reference_flags_nothing(self):
+        intervals = pd.DataFrame({'hole_name': ['DH-1'], 'standard_type': [1], 'depth_from': [0.0], 'depth_to': [1.0]})
+        reference = intervals.iloc[0:0]
+
+        np.testing.assert_array_equal(find_reference_overlaps(intervals, reference), [False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_index import ImageIndex, depth_bucket
+
+
+class ImageIndexTest(unittest.TestCase):
+
+    def test_depths_within_tolerance_match_across_a_bucket_boundary(self):
+        # 1.00004 and 1.00006 round into neighbouring buckets but are only 0.00002 apart
+        self.assertNotEqual(depth_bucket(1.00004), depth_bucket(1.00006))
+        index = ImageIndex()
+        index.add('DH-1', 1.00004, 3.00006, 1, 'image 1')
+
+        self.assertEqual(index.find_all('DH-1', 1.00006, 3.00004, 1), ['image 1'])
+        self.assertTrue(index.contains('DH-1', '1.00006', '3.00004', '1'))
+
+    def test_depths_outside_tolerance_do_not_match(self):
+        index = ImageIndex()
+        index.add('DH-1', 1.0, 3.0, 1)
+
+        self.assertFalse(index.contains('DH-1', 1.00015, 3.0, 1))
+        self.assertFalse(index.contains('DH-1', 1.0, 2.99985, 1))
+
+    def test_hole_and_standard_type_must_match(self):
+        index = ImageIndex()
+        index.add('DH-1', 1.0, 3.0, 1)
+
+        self.assertFalse(index.contains('DH-2', 1.0, 3.0, 1))
+        self.assertFalse(index.contains('DH-1', 1.0, 3.0, 2))
+
+    def test_find_all_returns_every_match_in_insertion_order(self):
+        index = ImageIndex()
+        index.add('DH-1', 1.0, 3.0, 1, 5)
+        index.add('DH-1', 1.00003, 3.0, 1, 9)
+
+        self.assertEqual(index.find_all('DH-1', 1.0, 3.0, 1), [5, 9])
+        self.assertEqual(index.count, 2)
+
+    def test_non_numeric_depths_only_match_the_same_text(self):
+        index = ImageIndex()
+        index.add('DH-1', 'n/a', 3.0, 1, 'raw')
+
+        self.assertEqual(index.find_all('DH-1', 'n/a', 3.0, 1), ['raw'])
+        self.assertFalse(index.contains('DH-1', 'N/A', 3.0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inventory_mirror import NEWEST_FIRST, InventoryMirror
+
+
+def make_image(image_id, hole_name):
+    return {'id': image_id, 'drillHole': {'name': hole_name}, 'depthFrom': image_id, 'depthTo': image_id + 1}
+
+
+class FakeClient:
+    """Serves Image/GetAll pages from a list, honouring the newest-first sort unless ignore_sorting is set"""
+
+    def __init__(self, items, page_size=2):
+        self.items = items
+        self.auth_config = {'page_size': page_size}
+        self.ignore_sorting = False
+        self.fail_after_pages = None
+        self.pages_served = 0
+
+    def get_page(self, url, params=None, skip_count=0, max_result_count=None):
+        items = sorted(self.items, key=lambda item: item['id'])
+        if (params or {}).get('Sorting') == NEWEST_FIRST and not self.ignore_sorting:
+            items.reverse()
+        self.pages_served += 1
+        page_size = max_result_count or self.auth_config['page_size']
+        return {'totalCount': len(items), 'items': items[skip_count:skip_count + page_size]}
+
+    def get_pages(self, url, params=None, page_size=None, workers=None):
+        skip = 0
+        while True:
+            if self.fail_after_pages is not None and skip >= self.fail_after_pages * self.auth_config['page_size']:
+                raise RuntimeError("connection lost")
+            page = self.get_page(url, params, skip, page_size)
+            yield page
+            skip += len(page['items'])
+            if not page['items'] or skip >= page['totalCount']:
+                return
+
+
+class InventoryMirrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = FakeClient([make_image(i, 'DH-1' if i % 2 else 'DH-2') for i in range(1, 6)])
+        self.mirror = InventoryMirror(self.client, 'http://api', os.path.join(self.directory.name, 'mirror.sqlite'))
+
+    def tearDown(self):
+        self.mirror.close()
+        self.directory.cleanup()
+
+    def mirrored_ids(self, hole_names=None):
+        return [item['id'] for item in self.mirror.iter_images(1, 2, hole_names)]
+
+    def test_first_sync_is_full(self):
+        self.assertEqual(self.mirror.sync_images(1, 2), ('full', 5))
+        self.assertEqual(self.mirrored_ids(), [1, 2, 3, 4, 5])
+        self.assertEqual(self.mirrored_ids(['DH-2']), [2, 4])
+
+    def test_new_records_are_fetched_incrementally(self):
+        self.mirror.sync_images(1, 2)
+        self.client.items += [make_image(6, 'DH-2'), make_image(7, 'DH-1')]
+        self.client.pages_served = 0
+
+        self.assertEqual(self.mirror.sync_images(1, 2), ('incremental', 2))
+        self.assertEqual(self.client.pages_served, 2)
+        self.assertEqual(self.mirrored_ids(), [1, 2, 3, 4, 5, 6, 7])
+
+    def test_mirrors_are_kept_per_project_and_prospect(self):
+        self.mirror.sync_images(1, 2)
+
+        self.assertEqual(self.mirror.sync_images(1, 3), ('full', 5))
+        self.assertEqual(self.mirror.sync_images(1, 2), ('incremental', 0))
+
+    def test_ignored_sort_order_falls_back_to_full_sync(self):
+        self.mirror.sync_images(1, 2)
+        self.client.items.append(make_image(6, 'DH-2'))
+        self.client.ignore_sorting = True
+
+        self.assertEqual(self.mirror.sync_images(1, 2), ('full', 6))
+        self.assertEqual(self.mirrored_ids(), [1, 2, 3, 4, 5, 6])
+
+    def test_deleted_records_fall_back_to_full_sync(self):
+        self.mirror.sync_images(1, 2)
+        del self.client.items[1]
+        self.client.items.append(make_image(6, 'DH-2'))
+
+        self.assertEqual(self.mirror.sync_images(1, 2), ('full', 5))
+        self.assertEqual(self.mirrored_ids(), [1, 3, 4, 5, 6])
+
+    def test_stale_mirror_is_rebuilt(self):
+        self.mirror.sync_images(1, 2)
+
+        self.assertEqual(self.mirror.sync_images(1, 2, max_age_hours=0), ('full', 5))
+        self.assertEqual(self.mirror.sync_images(1, 2, full=True), ('full', 5))
+
+    def test_failed_full_sync_keeps_previous_mirror(self):
+        self.mirror.sync_images(1, 2)
+        self.client.items.append(make_image(6, 'DH-2'))
+        self.client.fail_after_pages = 1
+
+        with self.assertRaises(RuntimeError):
+            self.mirror.sync_images(1, 2, full=True)
+        self.assertEqual(self.mirrored_ids(), [1, 2, 3, 4, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
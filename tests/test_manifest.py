@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from manifest import load_manifest
+
+HEADER = "HoleID,BoxFrom,BoxTo,Length,ImageType,OriginalFrom,OriginalTo,Validation,Original Filename,Full Path\n"
+
+
+class LoadManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        for name in ('a.jpg', 'b.jpg', 'c.jpg', 'd.jpg', 'e.jpg'):
+            open(os.path.join(self.directory.name, name), 'wb').close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_manifest(self, lines):
+        path = os.path.join(self.directory.name, 'filestoupload.csv')
+        with open(path, 'w') as f:
+            f.write(HEADER)
+            for hole_name, depth_from, depth_to, image_type, name in lines:
+                full_path = os.path.join(self.directory.name, name)
+                f.write(f"{hole_name},{depth_from},{depth_to},,{image_type},,,,{name},{full_path}\n")
+        return path
+
+    def test_problem_and_invalid_masks(self):
+        manifest = load_manifest(self.write_manifest([
+            ('DH-1', '0', '2.5', 'Dry', 'a.jpg'),
+            ('', '2.5', '5', 'Dry', 'b.jpg'),
+            ('DH-1', 'x', '5', 'Wet', 'c.jpg'),
+            ('DH-1', '5', '7.5', 'Wet', 'missing.jpg'),
+            ('DH-1', '9', '7.5', 'wet', 'd.jpg'),
+        ]))
+
+        self.assertEqual(manifest.problem.tolist(), [
+            None, "HoleID is empty", "BoxFrom/BoxTo is not a number", "File not found", None
+        ])
+        np.testing.assert_array_equal(manifest.invalid, [False, True, True, True, False])
+        # A reversed range is flagged but still uploaded
+        np.testing.assert_array_equal(manifest.reversed_range, [False, False, False, False, True])
+        self.assertEqual(manifest.summary(), {
+            'rows': 5, 'missing_hole': 1, 'invalid_depth': 1, 'reversed_range': 1, 'missing_file': 1,
+        })
+
+    def test_first_problem_in_priority_order_is_reported(self):
+        manifest = load_manifest(self.write_manifest([
+            ('', 'x', '5', 'Dry', 'missing.jpg'),
+            ('DH-1', 'x', '5', 'Dry', 'missing.jpg'),
+        ]))
+
+        self.assertEqual(manifest.problem.tolist(), ["HoleID is empty", "BoxFrom/BoxTo is not a number"])
+
+    def test_rows_are_typed_and_numbered(self):
+        manifest = load_manifest(self.write_manifest([
+            (' DH-1 ', '0', '2.5', 'Dry', 'a.jpg'),
+            ('DH-2', '2.5', '5', 'Wet', 'e.jpg'),
+            ('DH-1', '5', '7.5', 'DRY', 'b.jpg'),
+        ]))
+        rows = list(manifest.rows())
+
+        self.assertEqual([row.line_number for row in rows], [2, 3, 4])
+        self.assertEqual([row.hole_name for row in rows], ['DH-1', 'DH-2', 'DH-1'])
+        self.assertEqual([row.standard_type for row in rows], [1, 2, 1])
+        self.assertEqual(rows[1].depth_from, 2.5)
+        self.assertEqual(manifest.hole_names(), ['DH-1', 'DH-2'])
+        self.assertEqual([row.index for row in manifest.rows_where(manifest.standard_type == 1)], [0, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
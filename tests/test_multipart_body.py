@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from requests.models import RequestEncodingMixin
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import multipart_body
+from multipart_body import StreamingMultipartBody
+
+
+class StreamingMultipartBodyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.image_path = os.path.join(self.directory.name, 'KA-022_168.35_171.15_Dry_full.jpg')
+        self.image_bytes = bytes(range(256)) * 1000
+        with open(self.image_path, 'wb') as f:
+            f.write(self.image_bytes)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def encode_with_requests(self, fields):
+        """Encode the fields the way requests does for files=, opening the file paths"""
+        opened = []
+        files = {}
+        for name, spec in fields.items():
+            if spec[0] is None:
+                files[name] = spec
+            else:
+                opened.append(open(spec[1], 'rb'))
+                files[name] = (spec[0], opened[-1]) + tuple(spec[2:])
+        try:
+            return RequestEncodingMixin._encode_files(files, {})
+        finally:
+            for f in opened:
+                f.close()
+
+    def test_body_matches_requests_encoder(self):
+        fields = {
+            'HoleId': (None, '42'),
+            'image': ('KA-022 "box" 1.jpg', self.image_path, 'application/octet-stream'),
+            'DepthFrom': (None, '168.35'),
+            'DepthTo': (None, '171.15'),
+        }
+        expected_body, expected_content_type = self.encode_with_requests(fields)
+        boundary = expected_content_type.split('boundary=')[1]
+
+        with StreamingMultipartBody(fields, boundary=boundary) as body:
+            self.assertEqual(body.content_type, expected_content_type)
+            self.assertEqual(len(body), len(expected_body))
+            self.assertEqual(body.read(), expected_body)
+
+    def test_small_reads_and_rewind_return_the_same_bytes(self):
+        fields = {'HoleId': (None, '1'), 'image': ('box.jpg', self.image_path, 'image/jpeg')}
+        with StreamingMultipartBody(fields) as body:
+            whole = body.read()
+            body.seek(0)
+            chunks = []
+            while True:
+                chunk = body.read(1000)
+                if not chunk:
+                    break
+                self.assertLessEqual(len(chunk), 1000)
+                chunks.append(chunk)
+            self.assertEqual(b"".join(chunks), whole)
+            self.assertEqual(body.tell(), len(body))
+            self.assertIsNone(body._file)
+
+    def test_file_is_read_in_bounded_chunks_and_closed_on_exit(self):
+        fields = {'image': ('box.jpg', self.image_path)}
+        with StreamingMultipartBody(fields) as body:
+            body.read(200)
+            open_file = body._file
+            self.assertFalse(open_file.closed)
+            self.assertLessEqual(open_file.tell(), multipart_body.READ_CHUNK_SIZE)
+        self.assertTrue(open_file.closed)
+
+    def test_only_rewinding_to_the_start_is_supported(self):
+        with StreamingMultipartBody({'HoleId': (None, '1')}) as body:
+            with self.assertRaises(OSError):
+                body.seek(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from upload_journal import FAILED, IN_FLIGHT, PENDING, UPLOADED, UploadJournal
+
+
+def make_key(hole_name, depth_from, depth_to, standard_type=1):
+    return UploadJournal.row_key(hole_name, depth_from, depth_to, standard_type, f"{hole_name}_{depth_from}.jpg")
+
+
+class UploadJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'journal.sqlite')
+        self.journal = UploadJournal(self.path)
+
+    def tearDown(self):
+        self.journal.close()
+        self.directory.cleanup()
+
+    def test_rows_move_through_states(self):
+        key = make_key('DH-1', 0.0, 2.5)
+        self.assertEqual(self.journal.add_rows([key]), 1)
+        self.assertEqual(self.journal.get_state(key), PENDING)
+
+        self.journal.set_state(key, IN_FLIGHT)
+        self.assertEqual(self.journal.get_state(key), IN_FLIGHT)
+        self.journal.set_state(key, UPLOADED, image_id=7)
+        self.assertEqual(self.journal.get_state(key), UPLOADED)
+
+        # Adding the same row again leaves its state alone
+        self.assertEqual(self.journal.add_rows([key]), 0)
+        self.assertEqual(self.journal.get_state(key), UPLOADED)
+        self.assertIsNone(self.journal.get_state(make_key('DH-1', 2.5, 5.0)))
+
+    def test_state_survives_reopening(self):
+        key = make_key('DH-1', 0.0, 2.5)
+        self.journal.add_rows([key])
+        self.journal.set_state(key, UPLOADED)
+        self.journal.close()
+
+        self.journal = UploadJournal(self.path)
+        self.assertEqual(self.journal.get_state(key), UPLOADED)
+
+    def test_mark_uploaded_counts_only_changed_rows(self):
+        keys = [make_key('DH-1', 0.0, 2.5), make_key('DH-1', 2.5, 5.0)]
+        self.journal.add_rows(keys)
+        self.journal.set_state(keys[0], UPLOADED)
+
+        self.assertEqual(self.journal.mark_uploaded(keys, reason="already on server"), 1)
+        self.assertEqual(self.journal.state_counts(), {UPLOADED: 2})
+
+    def test_holes_to_check_selects_rows_that_may_be_on_the_server(self):
+        pending = make_key('DH-A', 0.0, 1.0)
+        in_flight = make_key('DH-B', 0.0, 1.0)
+        no_response = make_key('DH-C', 0.0, 1.0)
+        rejected = make_key('DH-D', 0.0, 1.0)
+        uploaded = make_key('DH-E', 0.0, 1.0)
+        self.journal.add_rows([pending, in_flight, no_response, rejected, uploaded])
+        self.journal.set_state(in_flight, IN_FLIGHT)
+        self.journal.set_state(no_response, FAILED, reason="timeout", no_response=True)
+        self.journal.set_state(rejected, FAILED, reason="HTTP 400")
+        self.journal.set_state(uploaded, UPLOADED)
+
+        self.assertEqual(self.journal.holes_to_check(), ['DH-A', 'DH-B', 'DH-C'])
+
+    def test_checks_and_counts_cover_only_the_current_manifest(self):
+        old_row = make_key('DH-OLD', 0.0, 1.0)
+        new_row = make_key('DH-NEW', 0.0, 1.0)
+        self.journal.add_rows([old_row])
+        self.journal.add_rows([new_row])
+
+        self.assertEqual(self.journal.holes_to_check(), ['DH-NEW'])
+        self.assertEqual(self.journal.state_counts(), {PENDING: 1})
+        self.assertEqual(self.journal.get_state(old_row), PENDING)
+
+
+if __name__ == '__main__':
+    unittest.main()
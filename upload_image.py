@@ -7,8 +7,21 @@ import pandas as pd
 import requests
 import json
 import os
+import threading
 from datetime import datetime
-from authentication import init_auth, authenticate, get_request_headers
+from authentication import init_auth, authenticate, ApiClient, ApiResponseError
+from concurrency import ordered_map, read_ahead
+from image_index import ImageIndex, DEPTH_TOLERANCE
+from upload_journal import UploadJournal, IN_FLIGHT, UPLOADED, FAILED
+from content_hash_cache import ContentHashCache
+from image_transform import ImageTransformer
+from multipart_body import StreamingMultipartBody
+from manifest import load_manifest
+from depth_intervals import find_depth_issues
+from process_pipeline import ProcessPipeline
+# Aliased so they do not shadow the upload journal's states
+from process_state import ProcessState, PROCESSED as PROCESS_PROCESSED, FAILED as PROCESS_FAILED
+from inventory_mirror import InventoryMirror
 import pathlib
 
 # Initialize authentication
@@ -19,16 +32,25 @@ api_key = auth_config['api_key']
 api_endpoint = auth_config['api_endpoint']
 use_api_key = auth_config['use_api_key']
 use_credentials = auth_config['use_credentials']
+upload_workers = auth_config['upload_workers']
+use_journal = auth_config['upload_journal']
+use_content_hash = auth_config['content_hash_dedup']
+hash_workers = auth_config['hash_workers']
+use_transform = auth_config['image_transform']
+transform_workers = auth_config['transform_workers']
+workflow_id = auth_config['workflow_id']
+process_after_upload = auth_config['process_after_upload']
+if process_after_upload and not workflow_id:
+    print("WARNING: PROCESS_AFTER_UPLOAD is set but WORKFLOW_ID is not. Images will only be uploaded.")
+    process_after_upload = False
+# ProcessImage workers share the API client with the upload workers
+process_workers = auth_config['process_workers'] if process_after_upload else 0
 num_errors = 1
 
 # %%
-df = pd.read_csv('filestoupload.csv')
-
-hole_names = df['HoleID'].values
-depth_from = df["BoxFrom"].values
-depth_to = df["BoxTo"].values
-image_types = df["ImageType"].values
-paths = df["Full Path"].values
+# Read and validate the whole manifest column-wise up front
+manifest = load_manifest('filestoupload.csv')
+hole_names = manifest.hole_names()
 
 # Create necessary directories for logs and results
 logs_dir = os.path.join("logs", "upload_image", "logs")
@@ -53,25 +75,44 @@ log.write(f"Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
 
 # Log file summary information
 log.write(f"=== File Processing Order ===\n")
-log.write(f"Total files to process: {len(df)}\n")
+log.write(f"Total files to process: {len(manifest)}\n")
 log.write("\nFiles in Processing Order:\n")
 log.write("-" * 50 + "\n")
 
 # Process files in the order they appear in the CSV
-for index, row in df.iterrows():
-    line_number = index + 2  # +2 because of 0-based index and header row
-    log.write(f"{index + 1}. File: {row['Original Filename']}\n")
-    log.write(f"   Line Number: {line_number}\n")
-    log.write(f"   Drill Hole: {row['HoleID']}\n")
-    log.write(f"   Image Type: {row['ImageType']}\n")
-    log.write(f"   Full Path: {row['Full Path']}\n")
-    log.write(f"   Depth Range: {row['BoxFrom']} - {row['BoxTo']}\n")
-    log.write("\n")
+log.writelines(
+    f"{row.index + 1}. File: {row.original_filename}\n"
+    f"   Line Number: {row.line_number}\n"
+    f"   Drill Hole: {row.hole_name}\n"
+    f"   Image Type: {row.image_type}\n"
+    f"   Full Path: {row.full_path}\n"
+    f"   Depth Range: {row.depth_from} - {row.depth_to}\n"
+    "\n"
+    for row in manifest.rows()
+)
 
 log.write("\n=== Processing Summary ===\n")
-log.write(f"Total Files: {len(df)}\n")
-log.write(f"Total Drill Holes: {len(df['HoleID'].unique())}\n")
-log.write(f"Unique Image Types: {set(df['ImageType'].values)}\n\n")
+log.write(f"Total Files: {len(manifest)}\n")
+log.write(f"Total Drill Holes: {len(hole_names)}\n")
+log.write(f"Unique Image Types: {set(manifest.image_type.tolist())}\n\n")
+
+# Report rows that cannot be uploaded, and depth ranges that look wrong
+validation = manifest.summary()
+log.write("=== Manifest Validation ===\n")
+log.write(f"Empty HoleID: {validation['missing_hole']}\n")
+log.write(f"BoxFrom/BoxTo not a number: {validation['invalid_depth']}\n")
+log.write(f"BoxTo <= BoxFrom: {validation['reversed_range']}\n")
+log.write(f"File not found: {validation['missing_file']}\n")
+for row in manifest.rows_where(manifest.invalid):
+    log.write(f"Line {row.line_number}: {row.problem}: {row.full_path}\n")
+for row in manifest.rows_where(manifest.reversed_range):
+    log.write(f"Line {row.line_number}: BoxTo {row.depth_to} <= BoxFrom {row.depth_from}: {row.full_path}\n")
+log.write("\n")
+invalid_rows = int(manifest.invalid.sum())
+if invalid_rows:
+    print(f"WARNING: {invalid_rows} rows in filestoupload.csv cannot be uploaded (empty HoleID, bad depths or missing file). See the log for details.")
+if validation['reversed_range']:
+    print(f"WARNING: {validation['reversed_range']} rows in filestoupload.csv have BoxTo <= BoxFrom. See the log for details.")
 
 print(f"Log file created: {log_file}")
 
@@ -83,17 +124,33 @@ if token is None and use_credentials:
     print("Authentication failed. Please check your credentials and try again.")
     exit(1)
 
+# Shared keep-alive session, with enough pooled connections for every upload (and process) worker
+client = ApiClient(auth_config, token, pool_size=max(auth_config['http_pool_size'], upload_workers + process_workers),
+                   max_concurrency=upload_workers + process_workers)
 
-# %%
-def get_all_images(projectId, prospectId, accessToken=None):
-    url = f"{api_endpoint}/services/app/Image/GetAll?ProjectIds={projectId}&ProspectIds={prospectId}&MaxResultCount=100000"
+# Optional local mirror of the inventory, refreshed incrementally instead of downloaded in full every run
+mirror = InventoryMirror(client, api_endpoint) if auth_config['inventory_mirror'] else None
+mirror_max_age = auth_config['mirror_max_age_hours']
 
-    payload = {}
-    headers = get_request_headers(api_key, use_api_key, api_endpoint, accessToken)
 
-    response = requests.request("GET", url, headers=headers, data=payload)
+# %%
+def get_all_images(projectId, prospectId):
+    """
+    Stream all images for the project and prospect, fetched page by page (or from the inventory mirror)
+    """
+    if mirror:
+        return mirror.synced_images(projectId, prospectId, max_age_hours=mirror_max_age)
+    url = f"{api_endpoint}/services/app/Image/GetAll"
+    return client.iter_items(url, params={'ProjectIds': projectId, 'ProspectIds': prospectId})
 
-    return response
+def get_images_for_holes(hole_names):
+    """
+    Stream the images of specific drill holes only, fetched page by page (or from the inventory mirror)
+    """
+    if mirror:
+        return mirror.synced_images(projectId, prospectId, hole_names, max_age_hours=mirror_max_age)
+    url = f"{api_endpoint}/services/app/Image/GetAll"
+    return client.iter_items_for_names(url, hole_names, workers=auth_config['name_chunk_workers'])
 
 def log_response_details(response, log_file=None):
     """
@@ -125,100 +182,176 @@ def log_response_details(response, log_file=None):
     
     return details_str
 
-res = get_all_images(projectId, prospectId, token)
+# Journal of each manifest row's upload state, so an interrupted run can resume
+journal = None
+resume_run = False
+if use_journal:
+    journal_file = os.path.join("logs", "upload_image", f"upload_journal_{projectId}_{prospectId}.sqlite")
+    journal = UploadJournal(journal_file)
+    manifest_keys = [UploadJournal.row_key(row.hole_name, row.depth_from, row.depth_to, row.standard_type, row.full_path)
+                     for row in manifest.rows()]
+    new_rows = journal.add_rows(manifest_keys)
+    # Every row was journaled by an earlier run, so the journal already knows what is on the server
+    resume_run = len(manifest) > 0 and new_rows == 0
 
-# Try to parse JSON with detailed error handling
-try:
-    data = res.json()['result']['items']
-except json.decoder.JSONDecodeError as e:
-    print(f"ERROR: Failed to decode JSON response: {str(e)}")
-    details = log_response_details(res, log)
-    log.write(f"\n=== JSON DECODE ERROR ===\n{str(e)}\n")
-    print("Request failed. See logs for details.")
-    exit(1)
-except KeyError as e:
-    print(f"ERROR: JSON response missing expected keys: {str(e)}")
-    log.write(f"\n=== JSON STRUCTURE ERROR ===\nMissing expected key: {str(e)}\n")
-    
-    # Log the actual JSON structure we received
-    try:
-        json_data = res.json()
-        log.write("Actual JSON structure received:\n")
-        log.write(json.dumps(json_data, indent=2) + "\n")
-        print(f"Response didn't contain the expected structure. Full JSON written to log.")
-    except Exception as inner_e:
-        log_response_details(res, log)
-        print(f"Failed to parse response as JSON: {str(inner_e)}")
-    
-    exit(1)
-uploaded_files_data = []
+    log.write("\n=== Upload Journal ===\n")
+    log.write(f"Journal file: {journal_file}\n")
+    log.write(f"New rows: {new_rows}, row states: {journal.state_counts()}\n")
+    print(f"Upload journal: {journal_file} ({new_rows} new rows, states: {journal.state_counts()})")
+
+# Index the uploaded files as each page arrives so each manifest row is checked with an O(1) lookup
+uploaded_index = ImageIndex()
 missing_field_errors = []
+inventory_count = 0
+# Depth ranges of server images in the manifest's drill holes, for the overlap and gap check
+manifest_hole_set = set(hole_names)
+server_intervals = []
 
-for idx, item in enumerate(data):
-    try:
-        # Check if all required fields exist
-        if 'drillHole' not in item or not item['drillHole'] or 'name' not in item['drillHole']:
-            missing_field_errors.append(f"Missing 'drillHole.name' in item {idx}")
-            continue
-            
-        if 'depthFrom' not in item:
-            missing_field_errors.append(f"Missing 'depthFrom' in item {idx}")
-            continue
-            
-        if 'depthTo' not in item:
-            missing_field_errors.append(f"Missing 'depthTo' in item {idx}")
-            continue
+if resume_run:
+    # Rows not reached yet, interrupted, or failed without a response may already be on the server
+    holes_to_check = journal.holes_to_check()
+    print(f"Resuming from upload journal; checking server inventory for {len(holes_to_check)} drill holes with unfinished uploads")
+    log.write(f"Resuming from upload journal; inventory refreshed only for drill holes with unfinished uploads: {holes_to_check}\n")
+    inventory = get_images_for_holes(holes_to_check) if holes_to_check else []
+else:
+    inventory = get_all_images(projectId, prospectId)
+
+try:
+    for idx, item in enumerate(inventory):
+        inventory_count += 1
+        try:
+            # Check if all required fields exist
+            if 'drillHole' not in item or not item['drillHole'] or 'name' not in item['drillHole']:
+                missing_field_errors.append(f"Missing 'drillHole.name' in item {idx}")
+                continue
+                
+            if 'depthFrom' not in item:
+                missing_field_errors.append(f"Missing 'depthFrom' in item {idx}")
+                continue
+                
+            if 'depthTo' not in item:
+                missing_field_errors.append(f"Missing 'depthTo' in item {idx}")
+                continue
+                
+            if 'standardType' not in item:
+                missing_field_errors.append(f"Missing 'standardType' in item {idx}")
+                continue
             
-        if 'standardType' not in item:
-            missing_field_errors.append(f"Missing 'standardType' in item {idx}")
+            # All required fields exist, add to the index (standardType is 1 for Dry, 2 for Wet)
+            uploaded_index.add(item['drillHole']['name'], item['depthFrom'], item['depthTo'], item['standardType'])
+            if item['drillHole']['name'] in manifest_hole_set:
+                server_intervals.append((item['drillHole']['name'], item['standardType'], item['depthFrom'],
+                                         item['depthTo'], f"server image {item.get('id')}", False))
+        except Exception as e:
+            # Catch any other unexpected errors
+            missing_field_errors.append(f"Error processing item {idx}: {str(e)}")
             continue
-        
-        # All required fields exist, add to our list
-        uploaded_files_data.append({
-            'hole_name': item['drillHole']['name'],
-            'depth_from': item['depthFrom'],
-            'depth_to': item['depthTo'],
-            'standard_type': item['standardType']  # 1 for Dry, 2 for Wet
-        })
-    except Exception as e:
-        # Catch any other unexpected errors
-        missing_field_errors.append(f"Error processing item {idx}: {str(e)}")
-        continue
+except ApiResponseError as e:
+    print(f"ERROR: {str(e)}")
+    log.write(f"\n=== API RESPONSE ERROR ===\n{str(e)}\n")
+    log_response_details(e.response, log)
+    print("Request failed. See logs for details.")
+    exit(1)
+
+# Record rows already on the server before any upload starts, so an interrupted run never re-uploads them
+if journal:
+    present_keys = [key for row, key in zip(manifest.rows(), manifest_keys)
+                    if not row.problem and uploaded_index.contains(row.hole_name, row.depth_from, row.depth_to, row.standard_type)]
+    marked = journal.mark_uploaded(present_keys, reason="already on server")
+    log.write(f"Journal: recorded {marked} rows found on the server as uploaded\n")
 
 # Log any errors encountered
 if missing_field_errors:
     print("\nWARNING: Some items in the API response were missing required fields:")
     for error in missing_field_errors:
         print(f"  - {error}")
-    print(f"Total errors: {len(missing_field_errors)} out of {len(data)} items")
+    print(f"Total errors: {len(missing_field_errors)} out of {inventory_count} items")
     
     # Also log to the log file
     log.write("\n=== API Response Field Errors ===\n")
     log.write(f"Some items in the API response were missing required fields:\n")
     for error in missing_field_errors:
         log.write(f"  - {error}\n")
-    log.write(f"Total errors: {len(missing_field_errors)} out of {len(data)} items\n\n")
-
-# The duplicate detection logic has been replaced with a field-by-field comparison approach
-# which will be applied during the file upload process
+    log.write(f"Total errors: {len(missing_field_errors)} out of {inventory_count} items\n\n")
 
 # Log duplicate check method
 log.write("\n=== Duplicate Check Method ===\n")
 log.write("Files are checked for duplicates by comparing:\n")
 log.write("1. Drill hole name\n")
-log.write("2. Depth from value\n")
-log.write("3. Depth to value\n")
-log.write("4. Image type (Dry/Wet)\n\n")
+log.write(f"2. Depth from value (within {DEPTH_TOLERANCE})\n")
+log.write(f"3. Depth to value (within {DEPTH_TOLERANCE})\n")
+log.write("4. Image type (Dry/Wet)\n")
+log.write(f"Indexed {uploaded_index.count} uploaded files for duplicate checks\n\n")
+
+# Report rows that duplicate an earlier row of the manifest itself. A valid row that duplicates an
+# earlier valid row is skipped, so only the first copy is uploaded.
+manifest_index = ImageIndex()
+manifest_duplicates = []
+manifest_duplicate_of = {}  # row index -> line number of the earlier valid row it duplicates
+valid_lines = set()
+for row in manifest.rows():
+    earlier_lines = manifest_index.find_all(row.hole_name, row.depth_from, row.depth_to, row.standard_type)
+    if earlier_lines:
+        manifest_duplicates.append((row.line_number, earlier_lines[0], row.full_path))
+        valid_earlier = [line for line in earlier_lines if line in valid_lines]
+        if valid_earlier and not row.problem:
+            manifest_duplicate_of[row.index] = valid_earlier[0]
+    manifest_index.add(row.hole_name, row.depth_from, row.depth_to, row.standard_type, row.line_number)
+    if not row.problem:
+        valid_lines.add(row.line_number)
+
+log.write("=== Duplicates Within Manifest ===\n")
+if manifest_duplicates:
+    print(f"\nWARNING: {len(manifest_duplicates)} rows in filestoupload.csv duplicate an earlier row (same hole, depth range and image type):")
+    for line_number, first_line, path in manifest_duplicates:
+        print(f"  - Line {line_number} duplicates line {first_line}: {path}")
+        log.write(f"Line {line_number} duplicates line {first_line}: {path}\n")
+    log.write(f"Total duplicate rows in manifest: {len(manifest_duplicates)}. "
+              f"{len(manifest_duplicate_of)} of them will be skipped; only the first row is uploaded\n\n")
+else:
+    log.write("No duplicate rows found in manifest.\n\n")
 
 print(f"Duplicated IDs logged to: {log_file}")
 
+# Check for overlapping or gapped boxes in each drill hole, against the server's boxes as well
+valid_rows = ~manifest.invalid
+manifest_intervals = pd.DataFrame({
+    'hole_name': manifest.hole_name[valid_rows],
+    'standard_type': manifest.standard_type[valid_rows].astype(int),
+    'depth_from': manifest.depth_from[valid_rows],
+    'depth_to': manifest.depth_to[valid_rows],
+    'label': [f"line {n}" for n in manifest.line_number[valid_rows].tolist()],
+    'from_manifest': True,
+})
+server_intervals = pd.DataFrame(server_intervals, columns=manifest_intervals.columns)
+server_intervals['depth_from'] = pd.to_numeric(server_intervals['depth_from'], errors='coerce')
+server_intervals['depth_to'] = pd.to_numeric(server_intervals['depth_to'], errors='coerce')
+server_intervals['standard_type'] = pd.to_numeric(server_intervals['standard_type'], errors='coerce')
+server_intervals = server_intervals.dropna(subset=['depth_from', 'depth_to', 'standard_type'])
+depth_issues = find_depth_issues(pd.concat([manifest_intervals, server_intervals], ignore_index=True))
+
+log.write("=== Box Depth Overlaps and Gaps ===\n")
+if resume_run:
+    log.write("Resumed run: only server boxes of drill holes with unfinished uploads were checked\n")
+if len(depth_issues):
+    overlaps = int((depth_issues['Issue'] == 'overlap').sum())
+    gaps = len(depth_issues) - overlaps
+    depth_check_file = os.path.join(logs_dir, f"depth_check_{timestamp}.csv")
+    depth_issues.to_csv(depth_check_file, index=False)
+    print(f"\nWARNING: Found {overlaps} overlapping and {gaps} gapped boxes (Dry/Wet checked separately). Details: {depth_check_file}")
+    for issue in depth_issues.itertuples(index=False):
+        log.write(f"{issue.Issue.capitalize()} in {issue.HoleID} (StandardType {issue.StandardType}) "
+                  f"{issue.From} - {issue.To}: {issue.First} / {issue.Second}\n")
+    log.write(f"Total: {overlaps} overlaps, {gaps} gaps. Saved to {depth_check_file}\n\n")
+else:
+    log.write("No overlapping or gapped boxes found.\n\n")
+
 # %%
-def create_drill_hole(accessToken, name, projectId, prospectId):
+def create_drill_hole(name, projectId, prospectId):
     """
     Create a drill hole with detailed error handling.
     
     Args:
-        accessToken: Authentication token
         name: Drill hole name
         projectId: Project ID
         prospectId: Prospect ID
@@ -237,10 +370,8 @@ def create_drill_hole(accessToken, name, projectId, prospectId):
         "isActive": True
     })
     
-    headers = get_request_headers(api_key, use_api_key, api_endpoint, accessToken)
-    
     try:
-        response = requests.request("POST", url, headers=headers, data=payload)
+        response = client.request("POST", url, data=payload)
         return response
     except requests.exceptions.RequestException as e:
         print(f"Network error when creating drill hole {name}: {str(e)}")
@@ -252,12 +383,15 @@ def create_drill_hole(accessToken, name, projectId, prospectId):
         error_response.url = url
         return error_response
 
-# create_drill_hole(token, "test", 4, 4)
+# create_drill_hole("test", 4, 4)
 
 # %%
-def upload_image(img_path, projectId, prospectId, holeId, standard_type, start, end, accessToken=None):
+def upload_image(img_path, projectId, prospectId, holeId, standard_type, start, end, send_path=None):
     """
     Upload an image to the API with detailed error handling.
+
+    Args:
+        send_path: Optional re-encoded copy of img_path to send instead of the original file
     
     Returns:
         tuple: (response, error_details) where error_details is None on success
@@ -265,14 +399,13 @@ def upload_image(img_path, projectId, prospectId, holeId, standard_type, start,
     """
     url = f"{api_endpoint}/services/app/Image/Create"
 
-    # Get headers without content-type to let requests set the correct multipart boundary
-    headers = get_request_headers(api_key, use_api_key, api_endpoint, accessToken)
+    # A re-encoded copy keeps the original name, with the extension of its new format
+    filename = os.path.basename(img_path)
+    if send_path and send_path != img_path:
+        filename = os.path.splitext(filename)[0] + os.path.splitext(send_path)[1]
     
-    # Remove content-type if present as requests will add the correct one
-    if 'Content-Type' in headers:
-        del headers['Content-Type']
-    
-    # Create a multipart form with all fields together
+    # Create a multipart form with all fields together; the image is streamed from disk
+    # in chunks as it is sent rather than read into memory
     multipart_form = {
         'Type': (None, '1'),
         'ImageClass': (None, '1'),
@@ -280,13 +413,17 @@ def upload_image(img_path, projectId, prospectId, holeId, standard_type, start,
         'ProjectId': (None, str(projectId)),
         'ProspectId': (None, str(prospectId)),
         'HoleId': (None, str(holeId)),
-        'image': (os.path.basename(img_path), open(img_path, 'rb'), 'application/octet-stream'),
+        'image': (filename, send_path or img_path, 'application/octet-stream'),
         'DepthFrom': (None, str(start)),
         'DepthTo': (None, str(end)),
     }
     
     try:
-        response = requests.request("POST", url, headers=headers, files=multipart_form)
+        # The with block closes the image file even if the request fails part way
+        with StreamingMultipartBody(multipart_form) as body:
+            # Replace the session's JSON content-type with the multipart boundary
+            headers = {'Content-Type': body.content_type}
+            response = client.request("POST", url, headers=headers, data=body)
         
         # If response is not successful, extract and format error details
         if response.status_code != 200:
@@ -367,116 +504,412 @@ def format_error_details(response, url):
     return "\n".join(error_info)
 
 # %%
-# Create all drill holes
-list_of_drill_holes = {}
-print("Creating drill holes...")
+def get_all_drill_holes():
+    """
+    Fetch the name -> ID map of the drill holes already on the server, page by page
+    """
+    url = f"{api_endpoint}/services/app/DrillHole/GetAll"
+    if mirror:
+        items = mirror.synced_drill_holes(projectId, prospectId, max_age_hours=mirror_max_age)
+    else:
+        items = client.iter_items(url, params={'ProjectIds': projectId, 'ProspectIds': prospectId})
+    drill_holes = {}
+    for item in items:
+        # Ignore holes from other projects/prospects if the server returns them
+        if item.get('projectId', projectId) != projectId or item.get('prospectId', prospectId) != prospectId:
+            continue
+        drill_holes[item['name']] = item['id']
+    return drill_holes
+
+def load_drill_hole_cache(cache_file):
+    """Load the cached drill hole name -> ID map from earlier runs"""
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def save_drill_hole_cache(cache_file, drill_holes):
+    """Save the drill hole name -> ID map for later runs"""
+    with open(cache_file, 'w', encoding='utf-8') as f:
+        json.dump(drill_holes, f, indent=2, sort_keys=True)
+
+def fetch_drill_holes():
+    """
+    Fetch the server's drill hole inventory once
+
+    Returns:
+        dict of name -> ID, or None if the request failed
+    """
+    try:
+        return get_all_drill_holes()
+    except (ApiResponseError, requests.exceptions.RequestException) as ex:
+        print(f"Could not fetch existing drill holes: {str(ex)}")
+        log.write(f"[{datetime.now()}] Could not fetch existing drill holes: {str(ex)}\n")
+        return None
+
+# Resolve drill hole names to IDs against one fetch of the server inventory. The map cached by
+# earlier runs is only used when that fetch fails. Holes that are still missing are created.
+drill_hole_cache_file = os.path.join("logs", "upload_image", f"drill_hole_cache_{projectId}_{prospectId}.json")
+cached_drill_holes = load_drill_hole_cache(drill_hole_cache_file)
+wanted_holes = hole_names
+
+print("Resolving drill holes...")
 log.write("\n=== Drill Hole Creation Log ===\n")
+server_drill_holes = fetch_drill_holes()
+if server_drill_holes is None:
+    list_of_drill_holes = {name: cached_drill_holes[name] for name in wanted_holes if name in cached_drill_holes}
+    print(f"WARNING: Using cached IDs for {len(list_of_drill_holes)} of {len(wanted_holes)} drill holes from {drill_hole_cache_file}")
+    log.write(f"[{datetime.now()}] {len(list_of_drill_holes)} of {len(wanted_holes)} drill holes resolved from cache {drill_hole_cache_file}\n")
+else:
+    list_of_drill_holes = {name: server_drill_holes[name] for name in wanted_holes if name in server_drill_holes}
+    stale_holes = [name for name in wanted_holes
+                   if name in cached_drill_holes and cached_drill_holes[name] != server_drill_holes.get(name)]
+    if stale_holes:
+        log.write(f"[{datetime.now()}] Cached IDs no longer on the server, dropped: {', '.join(stale_holes)}\n")
+    for name, holeId in list_of_drill_holes.items():
+        log.write(f"[{datetime.now()}] Found existing drill hole: {name} with ID: {holeId}\n")
+    print(f"Found {len(list_of_drill_holes)} of {len(wanted_holes)} drill holes on the server")
+
+missing_holes = [name for name in wanted_holes if name not in list_of_drill_holes]
+if missing_holes:
+    print(f"Creating {len(missing_holes)} drill holes...")
+    create_hole = lambda name: create_drill_hole(name, projectId, prospectId)
+    for name, future in ordered_map(create_hole, missing_holes, upload_workers):
+        try:
+            response = future.result()
+            
+            # Check if the response was successful
+            if response.status_code != 200:
+                error_details = format_error_details(response, f"{api_endpoint}/services/app/DrillHole/Create")
+                print(f"Failed to create drill hole {name}:")
+                print(error_details)
+                log.write(f"[{datetime.now()}] Failed to create drill hole {name}:\n{error_details}\n")
+                continue
+            
+            # Try to extract the ID from the JSON response
+            try:
+                holeId = response.json()["result"]["id"]
+                list_of_drill_holes[name] = holeId
+                print(f"Created drill hole: {name} with ID: {holeId}")
+                log.write(f"[{datetime.now()}] Created drill hole: {name} with ID: {holeId}\n")
+            except (json.JSONDecodeError, KeyError) as je:
+                print(f"Error parsing response for drill hole {name}: {str(je)}")
+                log_response_details(response, log)
+                log.write(f"[{datetime.now()}] Error parsing response for drill hole {name}: {str(je)}\n")
+        except Exception as ex:
+            print(f"Exception when creating drill hole {name}: {str(ex)}")
+            log.write(f"[{datetime.now()}] Exception when creating drill hole {name}: {str(ex)}\n")
+
+    # A failed create may mean the hole was created meanwhile (e.g. by another run), so check once more
+    still_missing = [name for name in missing_holes if name not in list_of_drill_holes]
+    if still_missing:
+        server_drill_holes = fetch_drill_holes() or {}
+        for name in still_missing:
+            if name in server_drill_holes:
+                list_of_drill_holes[name] = server_drill_holes[name]
+                print(f"Found existing drill hole: {name} with ID: {server_drill_holes[name]}")
+                log.write(f"[{datetime.now()}] Found existing drill hole: {name} with ID: {server_drill_holes[name]}\n")
+
+unresolved_holes = [name for name in wanted_holes if name not in list_of_drill_holes]
+if unresolved_holes:
+    print(f"WARNING: Could not find or create drill holes: {', '.join(unresolved_holes)}. Their files will fail to upload.")
+    log.write(f"[{datetime.now()}] Could not find or create drill holes: {', '.join(unresolved_holes)}\n")
 
-for name in set(hole_names):
-   try:
-       response = create_drill_hole(token, name, projectId, prospectId)
-       
-       # Check if the response was successful
-       if response.status_code != 200:
-           error_details = format_error_details(response, f"{api_endpoint}/services/app/DrillHole/Create")
-           print(f"Failed to create drill hole {name}:")
-           print(error_details)
-           log.write(f"[{datetime.now()}] Failed to create drill hole {name}:\n{error_details}\n")
-           continue
-       
-       # Try to extract the ID from the JSON response
-       try:
-           holeId = response.json()["result"]["id"]
-           list_of_drill_holes[name] = holeId
-           print(f"Created drill hole: {name} with ID: {holeId}")
-           log.write(f"[{datetime.now()}] Created drill hole: {name} with ID: {holeId}\n")
-       except (json.JSONDecodeError, KeyError) as je:
-           print(f"Error parsing response for drill hole {name}: {str(je)}")
-           log_response_details(response, log)
-           log.write(f"[{datetime.now()}] Error parsing response for drill hole {name}: {str(je)}\n")
-   except Exception as ex:
-       print(f"Exception when creating drill hole {name}: {str(ex)}")
-       log.write(f"[{datetime.now()}] Exception when creating drill hole {name}: {str(ex)}\n")
+# Replace the cache with this run's resolved map, the fallback for a run that cannot reach the inventory
+save_drill_hole_cache(drill_hole_cache_file, list_of_drill_holes)
 
 # %%
+# Optional content-hash deduplication: skip files whose exact bytes were already uploaded
+content_cache = None
+content_hashes = {}
+uploaded_content = set()
+content_seen = {}  # sha256 -> job of the latest row with that content in this run
+if use_content_hash:
+    content_cache = ContentHashCache(os.path.join("logs", "upload_image", "content_hash_cache.sqlite"))
+    print(f"Hashing image files with {hash_workers} worker(s)...")
+    content_hashes, hashed_count = content_cache.hash_files(manifest.full_path[~manifest.invalid], hash_workers)
+    uploaded_content = content_cache.uploaded_hashes(projectId, prospectId)
+    print(f"Hashed {hashed_count} new or changed files ({len(content_hashes)} files with known hashes)")
+    log.write("\n=== Content Hash Check ===\n")
+    log.write(f"Hashed {hashed_count} new or changed files, {len(content_hashes)} files with known hashes\n")
+    log.write(f"Content hashes already uploaded to this project/prospect: {len(uploaded_content)}\n")
+
+# %%
+# Optional re-encoding of images before upload, overlapped with the uploads themselves
+transformer = None
+if use_transform:
+    try:
+        transformer = ImageTransformer(os.path.join("logs", "upload_image", "transformed"),
+                                       quality=auth_config['image_quality'],
+                                       max_dimension=auth_config['image_max_dimension'],
+                                       workers=transform_workers)
+        print(f"Re-encoding images before upload ({transformer.describe()}) with {transform_workers} worker(s)")
+    except ImportError as ex:
+        print(f"WARNING: {str(ex)}. Uploading original files.")
+        log.write(f"[{datetime.now()}] Image transform disabled: {str(ex)}\n")
+
+def build_upload_job(row):
+    """
+    Check a validated manifest row against the uploaded files from the API.
+
+    Runs on the main thread so duplicate checks stay in manifest order.
+
+    Returns:
+        dict describing the row, with 'is_duplicate' set when the file is already uploaded
+        and 'problem' set when the row failed validation
+    """
+    hole_name = row.hole_name
+    img_path = row.full_path
+    start = row.depth_from
+    end = row.depth_to
+    standard_type = row.standard_type
+    row_key = UploadJournal.row_key(hole_name, start, end, standard_type, img_path)
+
+    # Rows the journal already recorded as uploaded are skipped without asking the server
+    skip_reason = None
+    journal_reason = None
+    duplicate_of_line = None
+    journaled_upload = journal is not None and journal.get_state(row_key) == UPLOADED
+    if row.problem:
+        pass  # Reported as a failed upload without contacting the server
+    # Check if file is already uploaded with a single index lookup
+    elif uploaded_index.contains(hole_name, start, end, standard_type):
+        skip_reason = "matching hole, depth range and image type"
+        journal_reason = "already on server"
+    elif journaled_upload:
+        skip_reason = "recorded as uploaded in upload journal"
+    elif row.index in manifest_duplicate_of:
+        duplicate_of_line = manifest_duplicate_of[row.index]
+        skip_reason = f"duplicates line {duplicate_of_line}"
+
+    # Identical bytes under a different path are skipped when content dedup is on. A copy of a file
+    # still being uploaded in this run waits for that upload and is only skipped if it succeeds.
+    content_hash = content_hashes.get(str(img_path))
+    content_previous = None
+    if skip_reason is None and content_hash and not row.problem:
+        if content_hash in uploaded_content:
+            skip_reason = "identical file content already uploaded"
+            journal_reason = skip_reason
+        else:
+            content_previous = content_seen.get(content_hash)
+    is_duplicate = skip_reason is not None
+
+    # Record the upload as in flight before it is handed to a worker
+    if journal and not is_duplicate and not row.problem:
+        journal.set_state(row_key, IN_FLIGHT)
+
+    job = {
+        'index': row.index,
+        'hole_name': hole_name,
+        'img_path': img_path,
+        'start': start,
+        'end': end,
+        'image_type': row.image_type,
+        'standard_type': standard_type,
+        'problem': row.problem,
+        'is_duplicate': is_duplicate,
+        'skip_reason': skip_reason,
+        'journal_reason': journal_reason,
+        'duplicate_of_line': duplicate_of_line,
+        'journaled_upload': journaled_upload,
+        'content_hash': content_hash,
+        'row_key': row_key,
+        'content_previous': content_previous,
+        # Set by run_upload_job once the file's content is known to be on the server (or not)
+        'content_done': threading.Event(),
+        'content_uploaded': False,
+        'content_skip_reason': None,
+        # Start re-encoding now so it runs while earlier files are being sent
+        'transform': transformer.submit(img_path, content_hash) if transformer and not is_duplicate and not row.problem else None
+    }
+    if content_hash and not is_duplicate and not row.problem:
+        content_seen[content_hash] = job
+    return job
+
+def run_upload_job(job):
+    """
+    Upload the image for a job built by build_upload_job (runs on a worker thread).
+
+    Returns:
+        tuple: (response, error_details) from upload_image, or (None, None) for duplicates
+    """
+    if job['is_duplicate']:
+        return None, None
+    if job['problem']:
+        return None, job['problem']
+    try:
+        previous = job['content_previous']
+        if previous:
+            # Earlier rows were submitted first, so this never waits on a row that has not started
+            previous['content_done'].wait()
+            if previous['content_uploaded']:
+                job['content_uploaded'] = True
+                job['content_skip_reason'] = f"identical file content to {previous['img_path']}"
+                return None, None
+        response, error_details = send_upload_job(job)
+        job['content_uploaded'] = response is not None and response.status_code == 200
+        return response, error_details
+    finally:
+        job['content_done'].set()
+
+def send_upload_job(job):
+    """Resolve the drill hole and re-encoded copy of a job, then upload it"""
+    holeId = list_of_drill_holes.get(str(job['hole_name']))
+    if holeId is None:
+        raise ValueError(f"Drill hole {job['hole_name']} could not be found or created")
+    send_path = None
+    if job['transform']:
+        try:
+            send_path = job['transform'].result()
+            if send_path == str(job['img_path']):
+                send_path = None  # Re-encoding did not make the file smaller
+        except Exception as ex:
+            # Fall back to the original file rather than failing the upload
+            job['transform_error'] = str(ex)
+    job['send_path'] = send_path
+    return upload_image(job['img_path'], projectId, prospectId, holeId,
+                        job['standard_type'], job['start'], job['end'], send_path)
+
+def get_created_image_id(response):
+    """Extract the new image ID from an Image/Create response, or None if it is missing"""
+    try:
+        return response.json()["result"]["id"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
 e = 0
-total_files = len(df)
+total_files = len(manifest)
 uploaded_count = 0
 skipped_count = 0
 failed_uploads = [] # List to store information about failed uploads
+source_bytes = 0 # Size of the original files uploaded
+sent_bytes = 0 # Size of the files actually sent
 
 # Start file upload section in log
 log.write("\n=== File Upload Log ===\n")
+log.write(f"Upload workers: {upload_workers}\n")
+log.write(f"Adaptive rate control: {'on' if client.rate_controller else 'off'}\n")
+log.write(f"Image transform: {transformer.describe() if transformer else 'off'}\n")
+log.write(f"Process after upload: {f'workflow {workflow_id}' if process_after_upload else 'off'}\n")
+
+# Optionally start the workflow on each image as soon as it is uploaded
+pipeline = None
+process_state = None
+processed_images = []
+process_failures = []
+if process_after_upload:
+    pipeline = ProcessPipeline(client, api_endpoint, workflow_id, process_workers, auth_config['process_rate'])
+    # Record processed images where execute_batch.py looks, so it does not process them again
+    pathlib.Path("logs/execute_batch").mkdir(parents=True, exist_ok=True)
+    process_state = ProcessState()
+    print(f"Images will be processed with workflow {workflow_id} as they are uploaded ({process_workers} worker(s))")
 
-print("\nStarting file uploads...")
-for index, row in df.iterrows():
+def handle_process_results(results):
+    """Log finished ProcessImage requests from the pipeline (runs on the main thread)"""
+    for image_id, info, process_response, error_details, finished_at in results:
+        image_info = {'Image ID': image_id, **info, 'Timestamp': finished_at}
+        if process_response is not None and process_response.status_code == 200:
+            print(f"  + Started workflow {workflow_id} for {info['Filename']} (image {image_id})")
+            log.write(f"[{finished_at}] Started workflow {workflow_id} for image {image_id}: {info['Filename']}\n")
+            processed_images.append(image_info)
+            process_state.record(image_id, workflow_id, PROCESS_PROCESSED, finished_at)
+        else:
+            error_msg = f"{error_details['error_type']}: {error_details['error_message']}"
+            print(f"  - Failed to process image: {info['Filename']}")
+            print(f"    Error: {error_msg}")
+            log.write(f"[{finished_at}] Failed to process image {image_id}: {info['Filename']}\n")
+            if error_details['status_code']:
+                log.write(f"    Status Code: {error_details['status_code']}\n")
+            if error_details['response_content']:
+                log.write(f"    Response Content: {error_details['response_content']}\n")
+            image_info['Error'] = error_msg
+            image_info['Error Type'] = error_details['error_type']
+            process_failures.append(image_info)
+            process_state.record(image_id, workflow_id, PROCESS_FAILED, finished_at)
+
+print(f"\nStarting file uploads with {upload_workers} worker(s)...")
+# Uploads run concurrently, but results are handled in manifest order so the
+# console output, log file and fail CSV are the same as a serial run
+upload_jobs = (build_upload_job(row) for row in manifest.rows())
+if transformer:
+    # Build jobs further ahead so there is always re-encoding work queued for the transform pool
+    upload_jobs = read_ahead(upload_jobs, transform_workers * 2)
+for position, (job, future) in enumerate(ordered_map(run_upload_job, upload_jobs, upload_workers)):
+    # Report the adaptive rate every 20 rows
+    if position and position % 20 == 0 and client.rate_controller:
+        rate_status = client.describe_rate()
+        print(f"Rate control: {rate_status}")
+        log.write(f"[{datetime.now()}] Rate control: {rate_status}\n")
+    # Log workflows started since the last row
+    if pipeline:
+        handle_process_results(pipeline.completed())
+    hole_name = job['hole_name']
+    img_path = job['img_path']
+    start = job['start']
+    end = job['end']
+    image_type = job['image_type']
+    standard_type = job['standard_type']
     try:
-        hole_name = row['HoleID']
-        img_path = row['Full Path']
-        start = row['BoxFrom']
-        end = row['BoxTo']
-        image_type = row['ImageType']
-        image_type = str(image_type).strip()
-        standard_type = 1 if image_type.lower() == "dry" else 2
-        # Check if file is already uploaded using field-by-field comparison
-        is_duplicate = False
-        for idx, uploaded_file in enumerate(uploaded_files_data):
-            try:
-                # Ensure we're comparing the same data types
-                hole_name_match = uploaded_file['hole_name'] == hole_name
-                
-                # Convert string values to float for depth comparison if needed
-                try:
-                    api_depth_from = float(uploaded_file['depth_from'])
-                    api_depth_to = float(uploaded_file['depth_to'])
-                    file_depth_from = float(start)
-                    file_depth_to = float(end)
-                    
-                    depth_from_match = abs(api_depth_from - file_depth_from) < 0.0001
-                    depth_to_match = abs(api_depth_to - file_depth_to) < 0.0001
-                except (ValueError, TypeError):
-                    # If we can't convert to float, do exact string comparison
-                    print(f"Warning: Could not convert depth values to float for comparison at index {idx}.")
-                    depth_from_match = str(uploaded_file['depth_from']) == str(start)
-                    depth_to_match = str(uploaded_file['depth_to']) == str(end)
-                
-                # Convert standard_type to integers for comparison if needed
-                try:
-                    api_standard_type = int(uploaded_file['standard_type'])
-                    file_standard_type = int(standard_type)
-                    standard_type_match = api_standard_type == file_standard_type
-                except (ValueError, TypeError):
-                    # If we can't convert to int, do exact string comparison
-                    print(f"Warning: Could not convert standard_type values to int for comparison at index {idx}.")
-                    standard_type_match = str(uploaded_file['standard_type']) == str(standard_type)
-                    
-                # Check if all four fields match
-                if hole_name_match and depth_from_match and depth_to_match and standard_type_match:
-                    is_duplicate = True
-                    break
-                    
-            except Exception as e:
-                # Log any unexpected errors during comparison
-                print(f"Error comparing file with uploaded data at index {idx}: {str(e)}")
-                log.write(f"[{datetime.now()}] Error comparing file with uploaded data at index {idx}: {str(e)}\n")
-                continue  # Continue to the next item
-                
-        if is_duplicate:
-            print(f"File already uploaded (matching hole, depth range and image type): {img_path}. Skipped.")
+        if job['duplicate_of_line']:
+            # Left pending in the journal: it is only on the server once the earlier row is
+            print(f"Row {job['skip_reason']} of filestoupload.csv: {img_path}. Skipped.")
             skipped_count += 1
-            log.write(f"[{datetime.now()}] File already uploaded (matching hole, depth range and image type): {img_path}. Skipped.\n")
+            log.write(f"[{datetime.now()}] Row {job['skip_reason']} of filestoupload.csv: {img_path}. Skipped.\n")
             continue
-        # Log the upload attempt
-        print(f"Going to upload: {os.path.basename(img_path)}, Raw Image Type: '{image_type}', StandardType: {standard_type}")
-        log.write(f"[{datetime.now()}] Going to upload: {os.path.basename(img_path)}, Raw Image Type: '{image_type}', StandardType: {standard_type}\n")
+        if job['is_duplicate']:
+            print(f"File already uploaded ({job['skip_reason']}): {img_path}. Skipped.")
+            skipped_count += 1
+            log.write(f"[{datetime.now()}] File already uploaded ({job['skip_reason']}): {img_path}. Skipped.\n")
+            if journal and not job['journaled_upload']:
+                journal.set_state(job['row_key'], UPLOADED, reason=job['journal_reason'])
+            continue
+        # Log the upload attempt (rows that failed validation, or wait for a copy with identical
+        # content, are reported below without one)
+        if not job['problem'] and not job['content_previous']:
+            print(f"Going to upload: {os.path.basename(img_path)}, Raw Image Type: '{image_type}', StandardType: {standard_type}")
+            log.write(f"[{datetime.now()}] Going to upload: {os.path.basename(img_path)}, Raw Image Type: '{image_type}', StandardType: {standard_type}\n")
         
-        # Perform the upload
-        response, error_details = upload_image(img_path, projectId, prospectId, list_of_drill_holes[hole_name], standard_type, start, end, token )
+        # Wait for the upload to finish
+        response, error_details = future.result()
+        if job['content_skip_reason']:
+            print(f"File already uploaded ({job['content_skip_reason']}): {img_path}. Skipped.")
+            skipped_count += 1
+            log.write(f"[{datetime.now()}] File already uploaded ({job['content_skip_reason']}): {img_path}. Skipped.\n")
+            if journal:
+                journal.set_state(job['row_key'], UPLOADED, reason=job['content_skip_reason'])
+            continue
+        if job['content_previous'] and not job['problem']:
+            print(f"Going to upload: {os.path.basename(img_path)} (the upload of a file with identical content failed)")
+            log.write(f"[{datetime.now()}] Going to upload: {img_path}; the upload of a file with identical content failed\n")
+        if job.get('transform_error'):
+            print(f"Could not re-encode {os.path.basename(img_path)}, sent the original file: {job['transform_error']}")
+            log.write(f"[{datetime.now()}] Could not re-encode {img_path}, sent the original file: {job['transform_error']}\n")
         
         if response is not None and response.status_code == 200:
             uploaded_count += 1
             print(f"+ Successfully uploaded {os.path.basename(img_path)} ({uploaded_count}/{total_files})")
             log.write(f"[{datetime.now()}] Successfully uploaded {os.path.basename(img_path)}\n")
+            if transformer:
+                original_size = os.path.getsize(img_path)
+                sent_size = os.path.getsize(job['send_path'] or img_path)
+                source_bytes += original_size
+                sent_bytes += sent_size
+                if job['send_path']:
+                    log.write(f"[{datetime.now()}] Sent re-encoded copy: {original_size / 1e6:.1f} MB -> {sent_size / 1e6:.1f} MB\n")
+            if journal:
+                journal.set_state(job['row_key'], UPLOADED, image_id=get_created_image_id(response))
+            if content_cache and job['content_hash']:
+                content_cache.mark_uploaded(projectId, prospectId, job['content_hash'],
+                                            get_created_image_id(response), str(img_path))
+            if pipeline:
+                image_id = get_created_image_id(response)
+                if image_id is None:
+                    print(f"Could not read the new image ID for {os.path.basename(img_path)}; it will not be processed")
+                    log.write(f"[{datetime.now()}] No image ID in the Image/Create response for {img_path}; not queued for processing\n")
+                else:
+                    pipeline.submit(image_id, {'Filename': os.path.basename(img_path), 'Drill Hole': hole_name,
+                                               'Depth From': start, 'Depth To': end})
         else:
             e += 1
             # Pretty print the detailed error information
@@ -512,6 +945,10 @@ for index, row in df.iterrows():
                 'Full Path': img_path,
                 'Error': error_details[:100] + '...' if error_details and len(error_details) > 100 else (error_details or f"Status code: {response.status_code if response else 'No response'}")
             })
+            if journal:
+                # Without a response the server may still have created the image; the next run checks
+                journal.set_state(job['row_key'], FAILED, reason=failed_uploads[-1]['Error'],
+                                  no_response=response is None and not job['problem'])
             
             # Still log error details to the log file, but separately
             if error_details:
@@ -535,6 +972,9 @@ for index, row in df.iterrows():
             'Full Path': img_path,
             'Error': f"Exception: {str(ex)[:100]}..." if len(str(ex)) > 100 else f"Exception: {str(ex)}"
         })
+        if journal:
+            journal.set_state(job['row_key'], FAILED, reason=failed_uploads[-1]['Error'],
+                              no_response=not job['problem'])
         
         # Log detailed exception information
         log.write(f"Exception details: {str(ex)}\n")
@@ -545,9 +985,17 @@ for index, row in df.iterrows():
         tb_str = traceback.format_exc()
         log.write(f"Traceback:\n{tb_str}\n")
 
+if pipeline:
+    print("\nWaiting for queued images to be processed...")
+    handle_process_results(pipeline.close())
+
 print(f"\nUpload complete. Successfully uploaded {uploaded_count}/{total_files} files.")
 print(f"Skipped {skipped_count} files already uploaded.")
 print(f"Failed to upload {len(failed_uploads)} files.")
+if transformer and source_bytes:
+    print(f"Sent {sent_bytes / 1e6:.1f} MB for {source_bytes / 1e6:.1f} MB of original images")
+if pipeline:
+    print(f"Started workflow {workflow_id} for {len(processed_images)} images, {len(process_failures)} failed.")
 log.write(f"\nUpload complete. Successfully uploaded {uploaded_count}/{total_files} files.\n")
 log.write(f"Skipped {skipped_count} files already uploaded.\n")
 log.write(f"Failed to upload {len(failed_uploads)} files.\n")
@@ -561,6 +1009,16 @@ if failed_uploads:
     fail_df.to_csv(fail_file, index=False)
     print(f"Failed uploads saved to: {fail_file} (same format as file_summary.csv for reuse)")
 
+# Same columns as the execute_batch.py result files
+if processed_images:
+    processed_file = os.path.join(success_dir, f"processed_images_{timestamp}.csv")
+    pd.DataFrame(processed_images).to_csv(processed_file, index=False)
+    print(f"Processed images saved to: {processed_file}")
+if process_failures:
+    process_fail_file = os.path.join(fail_dir, f"failed_processing_{timestamp}.csv")
+    pd.DataFrame(process_failures).to_csv(process_fail_file, index=False)
+    print(f"Images that failed to process saved to: {process_fail_file}")
+
 # Log summary section
 log.write("\n=== Final Summary ===\n")
 log.write(f"Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
@@ -568,15 +1026,33 @@ log.write(f"Total files processed: {total_files}\n")
 log.write(f"Successfully uploaded: {uploaded_count}\n")
 log.write(f"Skipped (already uploaded): {skipped_count}\n")
 log.write(f"Failed uploads: {len(failed_uploads)}\n")
+if client.rate_controller:
+    log.write(f"Final rate control state: {client.describe_rate()}\n")
+if pipeline:
+    log.write(f"Workflow {workflow_id} started: {len(processed_images)}, failed to start: {len(process_failures)}\n")
+if transformer:
+    log.write(f"Image transform: sent {sent_bytes / 1e6:.1f} MB for {source_bytes / 1e6:.1f} MB of original images\n")
 
 # Add Data Quality Summary
 log.write("\n=== Data Quality Summary ===\n")
 if missing_field_errors:
-    log.write(f"API Response had {len(missing_field_errors)} items with missing fields out of {len(data)} total items.\n")
+    log.write(f"API Response had {len(missing_field_errors)} items with missing fields out of {inventory_count} total items.\n")
     log.write(f"This could affect duplicate detection accuracy. See '=== API Response Field Errors ===' section above for details.\n")
 else:
     log.write("API Response data quality was good - no missing fields detected.\n")
 
+if journal:
+    log.write(f"\nUpload journal row states: {journal.state_counts()}\n")
+    journal.close()
+if content_cache:
+    content_cache.close()
+if transformer:
+    transformer.close()
+if process_state:
+    process_state.close()
+if mirror:
+    mirror.close()
+
 # Close the log file
 log.close()
 print(f"All processing logged to: {log_file}")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sqlite3
+from datetime import datetime
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+UPLOADED = 'uploaded'
+FAILED = 'failed'
+
+
+class UploadJournal:
+    """
+    Durable SQLite journal of the upload state of each manifest row
+
+    Rows are keyed on (hole name, depth from, depth to, standard type, full path)
+    and move through pending -> in_flight -> uploaded/failed. Every state change
+    is committed immediately, so after a crash or network loss the next run
+    knows exactly which rows still need uploading. Failed rows whose request got
+    no response are flagged, since the server may have accepted them anyway.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Path of the SQLite database file (created if missing)
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS upload_rows (
+                hole_name TEXT NOT NULL,
+                depth_from TEXT NOT NULL,
+                depth_to TEXT NOT NULL,
+                standard_type INTEGER NOT NULL,
+                full_path TEXT NOT NULL,
+                state TEXT NOT NULL,
+                image_id INTEGER,
+                reason TEXT,
+                no_response INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (hole_name, depth_from, depth_to, standard_type, full_path)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_upload_rows_state ON upload_rows (state)")
+        # Keys of the current manifest, so resume checks and counts ignore rows of older manifests
+        self.conn.execute("""
+            CREATE TEMP TABLE current_rows (
+                hole_name TEXT NOT NULL,
+                depth_from TEXT NOT NULL,
+                depth_to TEXT NOT NULL,
+                standard_type INTEGER NOT NULL,
+                full_path TEXT NOT NULL,
+                PRIMARY KEY (hole_name, depth_from, depth_to, standard_type, full_path)
+            )
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def row_key(hole_name, depth_from, depth_to, standard_type, full_path):
+        """Build the journal key for a manifest row"""
+        return (str(hole_name), str(depth_from), str(depth_to), int(standard_type), str(full_path))
+
+    def add_rows(self, row_keys):
+        """
+        Record manifest rows as pending, leaving rows already in the journal untouched
+
+        The rows also become the current manifest that holes_to_check() and
+        state_counts() report on.
+
+        Returns:
+            Number of rows that were not in the journal yet
+        """
+        row_keys = list(row_keys)
+        now = datetime.now().isoformat(timespec='seconds')
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO upload_rows "
+                "(hole_name, depth_from, depth_to, standard_type, full_path, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((*key, PENDING, now) for key in row_keys)
+            )
+            added = self.conn.total_changes - before
+            self.conn.execute("DELETE FROM current_rows")
+            self.conn.executemany("INSERT OR IGNORE INTO current_rows VALUES (?, ?, ?, ?, ?)", row_keys)
+        return added
+
+    def get_state(self, row_key):
+        """Return the state of a row, or None if it is not in the journal"""
+        row = self.conn.execute(
+            "SELECT state FROM upload_rows WHERE hole_name = ? AND depth_from = ? AND depth_to = ? "
+            "AND standard_type = ? AND full_path = ?",
+            row_key
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, row_key, state, image_id=None, reason=None, no_response=False):
+        """
+        Update the state of a row and commit it straight away
+
+        Args:
+            no_response: True for a failed request that got no response (e.g. a timeout)
+        """
+        with self.conn:
+            self.conn.execute(
+                "UPDATE upload_rows SET state = ?, image_id = COALESCE(?, image_id), reason = ?, no_response = ?, "
+                "updated_at = ? "
+                "WHERE hole_name = ? AND depth_from = ? AND depth_to = ? AND standard_type = ? AND full_path = ?",
+                (state, image_id, reason, int(no_response), datetime.now().isoformat(timespec='seconds'), *row_key)
+            )
+
+    def mark_uploaded(self, row_keys, reason):
+        """
+        Record rows as uploaded in one transaction, leaving rows already uploaded untouched
+
+        Returns:
+            Number of rows that changed state
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        before = self.conn.total_changes
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE upload_rows SET state = ?, reason = ?, no_response = 0, updated_at = ? "
+                "WHERE hole_name = ? AND depth_from = ? AND depth_to = ? AND standard_type = ? AND full_path = ? "
+                "AND state != ?",
+                ((UPLOADED, reason, now, *key, UPLOADED) for key in row_keys)
+            )
+        return self.conn.total_changes - before
+
+    def holes_to_check(self):
+        """
+        Return the sorted names of drill holes with rows that may be on the server without the journal knowing
+
+        These are rows not reached yet (pending), rows interrupted mid-upload
+        (in_flight) and failed rows whose request got no response.
+        """
+        rows = self.conn.execute(
+            "SELECT DISTINCT hole_name FROM upload_rows "
+            "JOIN current_rows USING (hole_name, depth_from, depth_to, standard_type, full_path) "
+            "WHERE state IN (?, ?) OR (state = ? AND no_response = 1) ORDER BY hole_name",
+            (PENDING, IN_FLIGHT, FAILED)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def state_counts(self):
+        """Return a dict of state -> number of rows of the current manifest"""
+        return dict(self.conn.execute(
+            "SELECT state, COUNT(*) FROM upload_rows "
+            "JOIN current_rows USING (hole_name, depth_from, depth_to, standard_type, full_path) GROUP BY state"
+        ).fetchall())
+
+    def close(self):
+        self.conn.close()